@@ -0,0 +1,90 @@
+import os
+import threading
+from typing import Any, Optional
+
+from dotenv import load_dotenv
+from pymongo import AsyncMongoClient
+
+
+__all__ = ["open_client", "get_db_client", "get_db", "close_client", "ping"]
+
+load_dotenv()
+
+DB_NAME = os.getenv("MONGO_DB_NAME", "Final")
+
+# 連線池設定（單位：毫秒；0 表示使用 pymongo 預設）
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "50"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+MONGO_MAX_IDLE_TIME_MS = int(os.getenv("MONGO_MAX_IDLE_TIME_MS", "0"))
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "5000"))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "10000"))
+MONGO_CONNECT_TIMEOUT_MS = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "10000"))
+MONGO_SOCKET_TIMEOUT_MS = int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", "0"))
+# 啟動時是否要求資料庫可連線（否則只記錄錯誤，之後由 /health/ready 回報）
+MONGO_REQUIRE_ON_STARTUP = os.getenv("MONGO_REQUIRE_ON_STARTUP", "false").lower() in ("1", "true", "yes")
+
+_client: Optional[AsyncMongoClient] = None
+_lock = threading.Lock()
+
+
+def _client_options() -> dict:
+    options = {
+        "maxPoolSize": MONGO_MAX_POOL_SIZE,
+        "minPoolSize": MONGO_MIN_POOL_SIZE,
+        "waitQueueTimeoutMS": MONGO_WAIT_QUEUE_TIMEOUT_MS or None,
+        "serverSelectionTimeoutMS": MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        "connectTimeoutMS": MONGO_CONNECT_TIMEOUT_MS,
+        "socketTimeoutMS": MONGO_SOCKET_TIMEOUT_MS or None,
+    }
+    if MONGO_MAX_IDLE_TIME_MS:
+        options["maxIdleTimeMS"] = MONGO_MAX_IDLE_TIME_MS
+    return options
+
+
+def open_client() -> AsyncMongoClient:
+    """
+    建立整個行程共用的 AsyncMongoClient（FastAPI lifespan 啟動時呼叫）。
+    pymongo 的 async API：等待資料庫時不佔用執行緒，同時處理的請求數只受連線池大小限制。
+    建立 client 不做網路 I/O；client 綁定在第一次使用它的 event loop 上。
+    """
+    global _client
+    with _lock:
+        if _client is None:
+            _client = AsyncMongoClient(os.getenv("uri"), **_client_options())
+        return _client
+
+
+def get_db_client() -> Optional[AsyncMongoClient]:
+    """共用的 AsyncMongoClient（尚未建立時建立，例如在 FastAPI 之外使用）；建立失敗回傳 None"""
+    if _client is not None:
+        return _client
+    try:
+        return open_client()
+    except Exception as exc:
+        print(f"Error connecting to MongoDB: {exc}")
+        return None
+
+
+def get_db(client: AsyncMongoClient) -> Any:
+    return client[DB_NAME]
+
+
+async def ping() -> bool:
+    """readiness 檢查：資料庫是否可連線"""
+    client = get_db_client()
+    if client is None:
+        return False
+    try:
+        await client.admin.command("ping")
+        return True
+    except Exception as exc:
+        print(f"MongoDB ping failed: {exc}")
+        return False
+
+
+async def close_client() -> None:
+    global _client
+    with _lock:
+        client, _client = _client, None
+    if client is not None:
+        await client.close()
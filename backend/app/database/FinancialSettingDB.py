@@ -1,30 +1,27 @@
-import os
 from typing import Any, Dict, Optional, List
-from dotenv import load_dotenv
-from pymongo import MongoClient
 
-load_dotenv()
+from pymongo import AsyncMongoClient
+
+try:
+    from .DBClient import get_db, get_db_client
+except ImportError:  # Allow running without package context
+    from database.DBClient import get_db, get_db_client  # type: ignore
 
-def get_db_client() -> Optional[MongoClient]:
-    uri = os.getenv("uri")
-    try:
-        client = MongoClient(uri, serverSelectionTimeoutMS=10000)
-        client.server_info()
-        return client
-    except Exception as exc:
-        print(f"Error connecting to MongoDB: {exc}")
-        return None
 
+# 連線由 DBClient 的共用 AsyncMongoClient（連線池）提供，這裡不再自行建立或關閉
+# 所有函式都是 coroutine，由 async 路由直接 await
 
-def _get_db(client: MongoClient) -> Any:
-    return client["Final"]
+
+async def ensure_indexes(client: AsyncMongoClient) -> None:
+    # 每個使用者只有一份設定；upsert 依 user_id 比對，並發儲存也不會產生兩份
+    await get_db(client)["FinancialSettings"].create_index("user_id", unique=True)
 
 
 # ===========================
 #   UPDATE (NO monthlyExpense)
 #   monthlyExpense 由後端自己算
 # ===========================
-def update_financial_setting(
+async def update_financial_setting(
     user_id: int,
     monthlyIncome: float,
     totalAsset: float,
@@ -39,7 +36,7 @@ def update_financial_setting(
         return False
 
     try:
-        collection = _get_db(client)["FinancialSettings"]
+        collection = get_db(client)["FinancialSettings"]
 
         # 後端自動加總 monthlyExpense
         monthlyExpense = sum(float(e.get("amount", 0)) for e in expenses)
@@ -55,12 +52,8 @@ def update_financial_setting(
             "fixedReturn": fixedReturn,
         }
 
-        existing = collection.find_one({"user_id": user_id})
-
-        if existing:
-            collection.update_one({"user_id": user_id}, {"$set": financial_data})
-        else:
-            collection.insert_one(financial_data)
+        # 一次 upsert：有就更新、沒有就新增
+        await collection.update_one({"user_id": user_id}, {"$set": financial_data}, upsert=True)
 
         return True
 
@@ -68,22 +61,19 @@ def update_financial_setting(
         print(f"Error updating financial setting: {exc}")
         return False
 
-    finally:
-        client.close()
-
 
 # ===========================
 #   GET financial setting
 # ===========================
-def get_financial_setting(user_id: int) -> Optional[Dict[str, Any]]:
+async def get_financial_setting(user_id: int) -> Optional[Dict[str, Any]]:
 
     client = get_db_client()
     if client is None:
         return None
 
     try:
-        collection = _get_db(client)["FinancialSettings"]
-        setting = collection.find_one({"user_id": user_id})
+        collection = get_db(client)["FinancialSettings"]
+        setting = await collection.find_one({"user_id": user_id})
 
         if setting is None:
             return None
@@ -103,6 +93,3 @@ def get_financial_setting(user_id: int) -> Optional[Dict[str, Any]]:
     except Exception as exc:
         print(f"Error getting financial setting: {exc}")
         return None
-
-    finally:
-        client.close()
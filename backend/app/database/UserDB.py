@@ -1,111 +1,115 @@
-import os
 from typing import Any, Dict, Optional
 
-from dotenv import load_dotenv
-from pymongo import MongoClient
+from pymongo import AsyncMongoClient, ReturnDocument
+from pymongo.errors import DuplicateKeyError, PyMongoError
 
+try:
+    from .DBClient import get_db, get_db_client
+except ImportError:  # Allow running without package context
+    from database.DBClient import get_db, get_db_client  # type: ignore
 
-load_dotenv()
 
+# 連線由 DBClient 的共用 AsyncMongoClient（連線池）提供，這裡不再自行建立或關閉
+# 所有函式都是 coroutine，由 async 路由直接 await
+# 共用 client 是延遲連線的，連不上要到第一次操作才會丟 PyMongoError；
+# create / modify_data / login 把它當成失敗處理（回傳 False / None），與舊版行為相同
 
-def get_db_client() -> Optional[MongoClient]:
-    uri = os.getenv("uri")
-    try:
-        client = MongoClient(uri, serverSelectionTimeoutMS=10000)
-        client.server_info()
-        return client
-    except Exception as exc:
-        print(f"Error connecting to MongoDB: {exc}")
-        return None
 
+# ensure_indexes 成功後設為 True；create 在索引確定存在之前不寫入
+_indexes_ready = False
 
-def _get_db(client: MongoClient) -> Any:
-    return client["Final"]
 
+async def ensure_indexes(client: AsyncMongoClient) -> None:
+    # email / user_id 唯一：重複註冊由資料庫擋下，不需要先查詢
+    global _indexes_ready
+    collection = get_db(client)["Users"]
+    await collection.create_index("email", unique=True)
+    await collection.create_index("user_id", unique=True)
+    _indexes_ready = True
 
-def maintain_user_id(client: MongoClient) -> Optional[int]:
-    collection = _get_db(client)["ID_Counter"]
-    if collection.count_documents({}) == 0:
-        collection.insert_one({"_id": "user_id", "seq": 1})
-    counter = collection.find_one({"_id": "user_id"})
+
+async def maintain_user_id(client: AsyncMongoClient) -> Optional[int]:
+    # 一次原子操作取號：seq 存的是「下一個」user_id（與舊資料相容），
+    # 第一次取號時 counter 不存在 → upsert 成 2 並回傳 1；並發註冊也不會拿到同一個號碼
+    collection = get_db(client)["ID_Counter"]
+    counter = await collection.find_one_and_update(
+        {"_id": "user_id"},
+        [{"$set": {"seq": {"$add": [{"$ifNull": ["$seq", 1]}, 1]}}}],
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    )
     if counter is None:
         return None
-    collection.update_one({"_id": "user_id"}, {"$inc": {"seq": 1}})
-    return int(counter["seq"])
+    return int(counter["seq"]) - 1
 
 
-def create(email: str, username: str, password: str) -> bool:
+async def create(email: str, username: str, password: str) -> bool:
     client = get_db_client()
     if client is None:
         return False
 
-    try:
-        if check_duplicate(email, client):
+    # 不先查詢 email：唯一索引讓重複註冊在 insert 時失敗（被擋下的註冊會跳過一個 user_id）。
+    # 因此索引還沒建好（啟動時連不上、既有資料有重複 email）就先補建，建不起來就拒絕註冊
+    if not _indexes_ready:
+        try:
+            await ensure_indexes(client)
+        except PyMongoError as exc:
+            print(f"Error creating Users indexes, registration refused: {exc}")
             return False
 
-        user_id = maintain_user_id(client)
+    try:
+        user_id = await maintain_user_id(client)
         if user_id is None:
             return False
 
-        collection = _get_db(client)["Users"]
+        collection = get_db(client)["Users"]
         user_data: Dict[str, Any] = {
             "user_id": user_id,
             "email": email,
             "username": username,
             "password": password,
         }
-        collection.insert_one(user_data)
+        await collection.insert_one(user_data)
         return True
-    finally:
-        client.close()
+    except DuplicateKeyError:
+        return False
+    except PyMongoError as exc:
+        print(f"Error creating user: {exc}")
+        return False
 
 
-def check_duplicate(email: str, client: Optional[MongoClient] = None) -> bool:
-    owns_client = False
-    if client is None:
-        client = get_db_client()
-        if client is None:
-            return False
-        owns_client = True
-
-    try:
-        collection = _get_db(client)["Users"]
-        user = collection.find_one({"email": email})
-        return user is not None
-    finally:
-        if owns_client:
-            client.close()
-
-def modify_data(user_id: int, username: str, new_password: str) -> bool:
+async def modify_data(user_id: int, username: str, new_password: str) -> bool:
     client = get_db_client()
     if client is None:
         return False
 
     try:
-        collection = _get_db(client)["Users"]
-        result = collection.update_one(
+        collection = get_db(client)["Users"]
+        result = await collection.update_one(
             {"user_id": user_id},
             {"$set": {"username": username, "password": new_password}}
         )
-        return result.modified_count > 0
-    finally:
-        client.close()
+    except PyMongoError as exc:
+        print(f"Error modifying user data: {exc}")
+        return False
+    return result.modified_count > 0
 
-def login(email: str) -> Optional[Dict[str, Any]]:
+async def login(email: str) -> Optional[Dict[str, Any]]:
     client = get_db_client()
     if client is None:
         return None
 
     try:
-        collection = _get_db(client)["Users"]
-        user = collection.find_one({"email": email})
-        if user is None:
-            return None
-        return {
-            "user_id": user.get("user_id"),
-            "email": user.get("email"),
-            "username": user.get("username"),
-            "password": user.get("password"),
-        }
-    finally:
-        client.close()
\ No newline at end of file
+        collection = get_db(client)["Users"]
+        user = await collection.find_one({"email": email})
+    except PyMongoError as exc:
+        print(f"Error finding user: {exc}")
+        return None
+    if user is None:
+        return None
+    return {
+        "user_id": user.get("user_id"),
+        "email": user.get("email"),
+        "username": user.get("username"),
+        "password": user.get("password"),
+    }
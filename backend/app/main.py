@@ -1,3 +1,6 @@
+import asyncio
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
@@ -5,13 +8,75 @@ try:
 	from .routers.SimulationApi import router as simulation_router
 	from .routers.UserApi import router as user_router
 	from .routers.FinancialSettingApi import router as financial_setting_router
+	from .routers.HealthApi import router as health_router
+	from .database.DBClient import MONGO_REQUIRE_ON_STARTUP, close_client, get_db_client, ping
+	from .database.UserDB import ensure_indexes as ensure_user_indexes
+	from .database.FinancialSettingDB import ensure_indexes as ensure_financial_setting_indexes
+	from .services.FinancialSettingService import close_financial_setting_cache
+	from .services.SimulationPool import shutdown_pool
+	from .services.SimulationDispatcher import simulation_dispatcher
+	from .services.SimulationJobService import simulation_jobs
 except ImportError:  # Allow running ``uvicorn main:app`` from the app folder
 	from routers.SimulationApi import router as simulation_router
 	from routers.UserApi import router as user_router
 	from routers.FinancialSettingApi import router as financial_setting_router
+	from routers.HealthApi import router as health_router
+	from database.DBClient import MONGO_REQUIRE_ON_STARTUP, close_client, get_db_client, ping
+	from database.UserDB import ensure_indexes as ensure_user_indexes
+	from database.FinancialSettingDB import ensure_indexes as ensure_financial_setting_indexes
+	from services.FinancialSettingService import close_financial_setting_cache
+	from services.SimulationPool import shutdown_pool
+	from services.SimulationDispatcher import simulation_dispatcher
+	from services.SimulationJobService import simulation_jobs
+
+
+async def prepare_database() -> bool:
+    """建立唯一索引（已存在時不做事）；註冊與設定儲存依賴它們保證不重複"""
+    client = get_db_client()
+    if client is None:
+        return False
+    try:
+        await ensure_user_indexes(client)
+        await ensure_financial_setting_indexes(client)
+        return True
+    except Exception as exc:
+        print(f"Error creating MongoDB indexes: {exc}")
+        return False
+
+
+async def prepare_database_until_ready(max_delay: float = 60.0) -> None:
+    """背景重試建立索引直到成功（間隔 1 秒起每次加倍，最多 max_delay 秒）"""
+    delay = 1.0
+    while not await prepare_database():
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, max_delay)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 整個行程共用一個 AsyncMongoClient（連線池），UserDB / FinancialSettingDB 都使用它
+    # 連不上時只記錄錯誤（模擬 API 不依賴資料庫），之後的請求會再嘗試建立
+    get_db_client()
+    if MONGO_REQUIRE_ON_STARTUP:
+        if not await ping() or not await prepare_database():
+            raise RuntimeError("MongoDB is not ready (unreachable or index creation failed).")
+        index_task = None
+    else:
+        # 在背景建立索引（失敗會重試），資料庫慢或連不上時不拖住啟動；
+        # 索引建好之前 UserDB.create 會自己補建，建不起來就拒絕註冊
+        index_task = asyncio.create_task(prepare_database_until_ready())
+    yield
+    if index_task is not None and not index_task.done():
+        index_task.cancel()
+    await close_client()
+    await close_financial_setting_cache()
+    # 關閉模擬用的執行緒與 process pool（若有啟用）
+    simulation_dispatcher.shutdown()
+    simulation_jobs.shutdown()
+    shutdown_pool()
 
 
-app = FastAPI(title="Finance Simulation API")
+app = FastAPI(title="Finance Simulation API", lifespan=lifespan)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=[
@@ -28,3 +93,4 @@ app.add_middleware(
 app.include_router(simulation_router)
 app.include_router(user_router)
 app.include_router(financial_setting_router)
+app.include_router(health_router)
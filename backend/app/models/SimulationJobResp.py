@@ -0,0 +1,14 @@
+from typing import Any, Dict, Literal, Optional
+
+from pydantic import BaseModel, Field
+
+
+class SimulationJobResp(BaseModel):
+    """Asynchronous simulation job status."""
+
+    job_id: str
+    status: Literal["queued", "running", "done", "failed", "cancelled"]
+    progress: float = Field(..., ge=0, le=100)
+    # lineChart / pieChart / statCards, only when status == "done"
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
@@ -1,6 +1,6 @@
-from typing import Dict, List, Literal, Optional
+from typing import Annotated, Dict, List, Literal, Optional
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, model_validator
 
 
 __all__ = [
@@ -8,7 +8,10 @@ __all__ = [
     "MarketModel",
     "Event",
     "Scenario",
+    "LineChartOptions",
     "SimulationRequest",
+    "SweepGrid",
+    "SimulationSweepRequest",
 ]
 
 
@@ -30,6 +33,9 @@ class MarketModel(BaseModel):
     annual_min: Optional[float] = None   # 年化報酬隨機區間下限（例如 -0.2）
     annual_max: Optional[float] = None   # 年化報酬隨機區間上限（例如 0.2）
 
+    # 變異數縮減：random（一般亂數）/ antithetic（對偶變量）/ sobol（scrambled Sobol 準蒙地卡羅，需要 scipy）
+    sampling: Literal["random", "antithetic", "sobol"] = "random"
+
 
 class Event(BaseModel):    ### 期間型事件
     # 開始月
@@ -42,6 +48,15 @@ class Event(BaseModel):    ### 期間型事件
     amount: Optional[float] = None ## expense, market_ovveride用
     delta: Optional[float] = None ## income/invest_ratio_delta用  ## 沒填end的話就是永久變動
 
+    @model_validator(mode="after")
+    def _check_market_override(self) -> "Event":
+        # market_override 的 amount 是年化報酬（絕對值大於 1 視為百分比）；-100% 以下換算月報酬會是 NaN
+        if self.type == "market_override" and self.amount is not None:
+            annual = self.amount / 100.0 if abs(self.amount) > 1.0 else self.amount
+            if annual <= -1.0:
+                raise ValueError("market_override amount must be greater than -100% (annual return).")
+        return self
+
 
 class Scenario(BaseModel):
     """
@@ -57,6 +72,19 @@ class Scenario(BaseModel):
     events: Optional[List[Event]] = None
 
 
+class LineChartOptions(BaseModel):
+    """
+    lineChart 的輸出解析度：
+    - monthly: 全部 120 個月
+    - every_nth: 每 step 個月一點（以第 120 個月為最後一點）
+    - yearly: 每年年底一點（= every_nth, step=12）
+    - lttb: 以 LTTB（largest-triangle-three-buckets）挑出 points 個點
+    """
+    mode: Literal["monthly", "every_nth", "yearly", "lttb"] = "monthly"
+    step: int = Field(1, ge=1, le=120)
+    points: int = Field(30, ge=3, le=120)
+
+
 class SimulationRequest(BaseModel):
     initial_assets: float = Field(..., ge=0)  # 新增：初始總資產（必填）
     income_monthly: float = Field(..., ge=0)
@@ -65,4 +93,30 @@ class SimulationRequest(BaseModel):
     market_model: MarketModel
     scenarios: List[Scenario] = []         # 額外情境（Baseline 會自動加）
     paths: int = Field(1000, ge=100, le=20000)   # 要跑幾條路徑（Monte Carlo）
-    seed: Optional[int] = 12345
\ No newline at end of file
+    seed: Optional[int] = 12345
+    # 額外的分位數帶（0~100，例如 [10, 90, 25, 75]），會放在 lineChart 每個情境的 bands
+    extra_percentiles: List[Annotated[float, Field(gt=0, lt=100)]] = []
+    # 自適應路徑數：期末 P05/P50/P95 的相對標準誤低於此值就停止（例如 0.01），paths 為上限；None 表示固定跑 paths 條
+    quantile_tolerance: Optional[float] = Field(None, gt=0, lt=1)
+    # 引擎數值精度：float32 記憶體減半，期末分位數相對誤差約 1e-6（見 README）
+    precision: Literal["float64", "float32"] = "float64"
+    # lineChart 的輸出解析度（預設每月一點）
+    line_chart: LineChartOptions = Field(default_factory=LineChartOptions)
+
+
+class SweepGrid(BaseModel):
+    """
+    參數掃描的格點，每個非空的軸是熱圖的一個維度（空的軸不掃描，沿用 base 的值）：
+    - invest_ratio: 投資比例（0~1）
+    - income_monthly: 月收入
+    - expenses_delta: 各支出類別的調整比例，例如 {"food": [-0.3, -0.2, -0.1, 0]}（-0.3 代表 -30%）
+    """
+    invest_ratio: List[Annotated[float, Field(ge=0, le=1)]] = []
+    income_monthly: List[Annotated[float, Field(ge=0)]] = []
+    expenses_delta: Dict[str, List[Annotated[float, Field(ge=-1)]]] = {}
+
+
+class SimulationSweepRequest(BaseModel):
+    # base 的 scenarios / extra_percentiles / quantile_tolerance / line_chart 不使用
+    base: SimulationRequest
+    grid: SweepGrid
@@ -1,25 +1,36 @@
-from fastapi import APIRouter, HTTPException, status
+from typing import Optional
+
+from fastapi import APIRouter, Header, HTTPException, Response, status
 
 try:
     from ..models.FinancialSettingReq import FinancialSettingReq
     from ..models.FinancialSettingResp import FinancialSettingResp
     from ..services.FinancialSettingService import (
-        get_financial_setting as get_financial_setting_service,
+        get_financial_setting_body as get_financial_setting_body_service,
         update_financial_setting as update_financial_setting_service,
     )
 except ImportError:  # Allow running without package context
     from models.FinancialSettingReq import FinancialSettingReq  # type: ignore
     from models.FinancialSettingResp import FinancialSettingResp  # type: ignore
     from services.FinancialSettingService import (  # type: ignore
-        get_financial_setting as get_financial_setting_service,
+        get_financial_setting_body as get_financial_setting_body_service,
         update_financial_setting as update_financial_setting_service,
     )
 
 router = APIRouter(tags=["financial_setting"], prefix="/financial-setting")
 
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    # If-None-Match 可能是 "*"、多個以逗號分隔的 ETag，或弱 ETag（W/"..."）
+    if not if_none_match:
+        return False
+    candidates = [item.strip() for item in if_none_match.split(",")]
+    return "*" in candidates or any(item.removeprefix("W/") == etag for item in candidates)
+
+
 @router.post("/") # create or update financial setting
-def post_financial_setting(request: FinancialSettingReq):
-    success = update_financial_setting_service(request)
+async def post_financial_setting(request: FinancialSettingReq):
+    success = await update_financial_setting_service(request)
     if not success:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -28,11 +39,16 @@ def post_financial_setting(request: FinancialSettingReq):
     return {"message": "Financial setting updated successfully."}
 
 @router.get("/{user_id}", response_model=FinancialSettingResp)
-def get_financial_setting(user_id: int) -> FinancialSettingResp:
-    financial_setting = get_financial_setting_service(user_id)
-    if financial_setting is None:
+async def get_financial_setting(user_id: int, if_none_match: Optional[str] = Header(default=None)):
+    cached = await get_financial_setting_body_service(user_id)
+    if cached is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Financial setting not found. Financial setting may not be set up for this user.",
         )
-    return financial_setting
\ No newline at end of file
+    body, etag = cached
+    # no-cache：瀏覽器可以保留，但每次都要帶 If-None-Match 回來確認；設定沒變就回 304（沒有內容）
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if _etag_matches(if_none_match, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
@@ -0,0 +1,25 @@
+from fastapi import APIRouter, HTTPException, status
+
+try:
+    from ..database.DBClient import ping
+except ImportError:  # Allow running without package context
+    from database.DBClient import ping  # type: ignore
+
+
+router = APIRouter(tags=["health"], prefix="/health")
+
+
+@router.get("/live")
+async def liveness():
+    return {"status": "ok"}
+
+
+@router.get("/ready")
+async def readiness():
+    # 資料庫連不上時回 503，讓負載平衡器暫時不導流量進來
+    if not await ping():
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Database is not reachable.",
+        )
+    return {"status": "ready"}
@@ -1,16 +1,291 @@
-from fastapi import APIRouter
+import json
+from typing import List
+
+from fastapi import APIRouter, Body, Header, HTTPException, Response, status
+from fastapi.responses import StreamingResponse
 
 try:
-    from ..models.SimulationReq import SimulationRequest
-    from ..services.SimulationService import simulate_financial_plan
+    from ..models.SimulationJobResp import SimulationJobResp
+    from ..models.SimulationReq import Scenario, SimulationRequest, SimulationSweepRequest
+    from ..services.SimulationDispatcher import SimulationBusyError, SimulationStream, simulation_dispatcher
+    from ..services.SimulationEncoding import (
+        JSON_MEDIA_TYPE,
+        MSGPACK_MEDIA_TYPE,
+        negotiate_encoding,
+        negotiate_format,
+    )
+    from ..services.SimulationJobService import simulation_jobs
+    from ..services.SimulationService import (
+        SIMULATION_BATCH_MAX_REQUESTS,
+        SIMULATION_SWEEP_MAX_POINTS,
+        SOBOL_AVAILABLE,
+        SimulationMemoryError,
+        cached_simulation_body,
+        check_memory_budget,
+        iter_batch_events,
+        iter_simulation_events,
+        simulate_batch_body,
+        simulate_financial_plan_body,
+        simulate_sweep_body,
+        simulation_cache_stats,
+        sweep_points,
+    )
+    from ..services.UserSimulationService import get_user_baseline, user_baseline_cache_stats
 except ImportError:  # Allow running without package context
-    from models.SimulationReq import SimulationRequest  # type: ignore
-    from services.SimulationService import simulate_financial_plan  # type: ignore
+    from models.SimulationJobResp import SimulationJobResp  # type: ignore
+    from models.SimulationReq import Scenario, SimulationRequest, SimulationSweepRequest  # type: ignore
+    from services.SimulationDispatcher import SimulationBusyError, SimulationStream, simulation_dispatcher  # type: ignore
+    from services.SimulationEncoding import (  # type: ignore
+        JSON_MEDIA_TYPE,
+        MSGPACK_MEDIA_TYPE,
+        negotiate_encoding,
+        negotiate_format,
+    )
+    from services.SimulationJobService import simulation_jobs  # type: ignore
+    from services.SimulationService import (  # type: ignore
+        SIMULATION_BATCH_MAX_REQUESTS,
+        SIMULATION_SWEEP_MAX_POINTS,
+        SOBOL_AVAILABLE,
+        SimulationMemoryError,
+        cached_simulation_body,
+        check_memory_budget,
+        iter_batch_events,
+        iter_simulation_events,
+        simulate_batch_body,
+        simulate_financial_plan_body,
+        simulate_sweep_body,
+        simulation_cache_stats,
+        sweep_points,
+    )
+    from services.UserSimulationService import get_user_baseline, user_baseline_cache_stats  # type: ignore
 
 
 router = APIRouter(tags=["simulation"])
 
 
+async def _dispatch(fn, *args):
+    # 模擬交給專用且有上限的 executor；佇列滿了就回 503 + Retry-After
+    try:
+        return await simulation_dispatcher.run(fn, *args)
+    except SimulationBusyError as exc:
+        raise _busy(exc)
+
+
+def _busy(exc: SimulationBusyError) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Simulation service is busy. Please retry later.",
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
+def _validate(request: SimulationRequest) -> None:
+    # 在排進模擬佇列之前就擋下無法執行的請求：選用套件沒安裝回 400，超出記憶體預算回 422
+    if request.market_model.sampling == "sobol" and not SOBOL_AVAILABLE:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Sobol sampling requires scipy, which is not installed on this server.",
+        )
+    try:
+        check_memory_budget(request)
+    except SimulationMemoryError as exc:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_CONTENT, detail=str(exc))
+
+
+def _validate_batch(requests: List[SimulationRequest]) -> None:
+    if len(requests) > SIMULATION_BATCH_MAX_REQUESTS:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_CONTENT,
+            detail=f"A batch may contain at most {SIMULATION_BATCH_MAX_REQUESTS} requests.",
+        )
+    for index, request in enumerate(requests):
+        try:
+            _validate(request)
+        except HTTPException as exc:
+            raise HTTPException(status_code=exc.status_code, detail=f"requests[{index}]: {exc.detail}")
+
+
+def _job_or_404(job):
+    if job is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Simulation job not found. It may have expired.",
+        )
+    return job.snapshot()
+
+
+def _encoded_response(body: bytes, content_encoding, fmt: str) -> Response:
+    headers = {"Vary": "Accept, Accept-Encoding"}
+    if content_encoding is not None:
+        headers["Content-Encoding"] = content_encoding
+    return Response(
+        content=body,
+        media_type=MSGPACK_MEDIA_TYPE if fmt == "msgpack" else JSON_MEDIA_TYPE,
+        headers=headers,
+    )
+
+
+async def _simulation_response(
+    request: SimulationRequest, accept: str, accept_encoding: str, baseline=None
+) -> Response:
+    # 內容協商：Accept 選 JSON 或 MessagePack，Accept-Encoding 選 br / gzip；
+    # 回傳已序列化（並壓縮）的內容，快取命中時直接回傳，不佔用模擬佇列
+    _validate(request)
+    fmt = negotiate_format(accept)
+    encoding = negotiate_encoding(accept_encoding)
+    entry = cached_simulation_body(request, fmt, encoding)
+    if entry is None:
+        entry = await _dispatch(simulate_financial_plan_body, request, fmt, encoding, False, baseline)
+    body, content_encoding = entry
+    return _encoded_response(body, content_encoding, fmt)
+
+
 @router.post("/simulate")
-def simulate(request: SimulationRequest):
-    return simulate_financial_plan(request)
+async def simulate(
+    request: SimulationRequest,
+    accept: str = Header(default=""),
+    accept_encoding: str = Header(default=""),
+):
+    return await _simulation_response(request, accept, accept_encoding)
+
+
+@router.post("/simulate/user/{user_id}")
+async def simulate_user(
+    user_id: int,
+    scenarios: List[Scenario] = Body(default_factory=list),
+    accept: str = Header(default=""),
+    accept_encoding: str = Header(default=""),
+):
+    # 以伺服器端儲存的財務設定當 baseline，body 只需要情境卡（list）
+    try:
+        baseline = await get_user_baseline(user_id)
+    except SimulationBusyError as exc:
+        raise _busy(exc)
+    if baseline is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Financial setting not found. Financial setting may not be set up for this user.",
+        )
+    return await _simulation_response(baseline.with_scenarios(scenarios), accept, accept_encoding, baseline)
+
+
+async def _encode_events(events, sse: bool):
+    # NDJSON：每行一個 {"event": ..., "data": ...}；SSE：event/data 兩行加空行
+    async for event, data in events:
+        payload = json.dumps(data, ensure_ascii=False, allow_nan=False, separators=(",", ":"))
+        if sse:
+            yield f"event: {event}\ndata: {payload}\n\n".encode("utf-8")
+        else:
+            yield f'{{"event":"{event}","data":{payload}}}\n'.encode("utf-8")
+
+
+class _EventStreamResponse(StreamingResponse):
+    """
+    串流模擬結果；回應結束時一定呼叫 events.aclose() 歸還派送器名額。
+    用戶端在開始讀取前就斷線、或送出時斷線，body generator 不會跑到結尾，不能只靠它的 finally。
+    """
+
+    def __init__(self, events: SimulationStream, sse: bool) -> None:
+        super().__init__(
+            _encode_events(events, sse),
+            media_type="text/event-stream" if sse else "application/x-ndjson",
+            headers={"Cache-Control": "no-cache"},
+        )
+        self.events = events
+
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            await self.events.aclose()
+
+
+@router.post("/simulate/stream")
+async def simulate_stream(request: SimulationRequest, accept: str = Header(default="")):
+    # 每個情境模擬完成就送出它的 lineChart 序列，statCards 最後送出；
+    # Accept: text/event-stream 時用 SSE，否則用 NDJSON
+    _validate(request)
+    sse = "text/event-stream" in accept
+    try:
+        events = simulation_dispatcher.stream(iter_simulation_events(request))
+    except SimulationBusyError as exc:
+        raise _busy(exc)
+    return _EventStreamResponse(events, sse)
+
+
+@router.post("/simulate/batch")
+async def simulate_batch(
+    requests: List[SimulationRequest],
+    accept: str = Header(default=""),
+    accept_encoding: str = Header(default=""),
+):
+    # 一次模擬多個請求：依 (市場模型, paths, seed, ...) 分組共用月報酬；回傳 {"results": [...]}，順序與 body 相同
+    _validate_batch(requests)
+    fmt = negotiate_format(accept)
+    encoding = negotiate_encoding(accept_encoding)
+    body, content_encoding = await _dispatch(simulate_batch_body, requests, fmt, encoding)
+    return _encoded_response(body, content_encoding, fmt)
+
+
+@router.post("/simulate/batch/stream")
+async def simulate_batch_stream(requests: List[SimulationRequest], accept: str = Header(default="")):
+    # 每個請求完成就送出 result 事件（data 帶 index，順序依分組而定），最後送出 done
+    _validate_batch(requests)
+    sse = "text/event-stream" in accept
+    try:
+        events = simulation_dispatcher.stream(iter_batch_events(requests))
+    except SimulationBusyError as exc:
+        raise _busy(exc)
+    return _EventStreamResponse(events, sse)
+
+
+@router.post("/simulate/sweep")
+async def simulate_sweep(
+    request: SimulationSweepRequest,
+    accept: str = Header(default=""),
+    accept_encoding: str = Header(default=""),
+):
+    # 參數掃描：整個格點一次模擬（共用月報酬），回傳期末 P05/P50/P95 的熱圖
+    points = sweep_points(request.grid)
+    if points == 0 or points > SIMULATION_SWEEP_MAX_POINTS:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_CONTENT,
+            detail=f"The sweep grid must have between 1 and {SIMULATION_SWEEP_MAX_POINTS} points (got {points}).",
+        )
+    # 掃描不使用 base 的 scenarios / quantile_tolerance（格點依記憶體預算分批），只檢查單列能否執行
+    _validate(request.base.model_copy(update={"scenarios": [], "quantile_tolerance": None}))
+    fmt = negotiate_format(accept)
+    encoding = negotiate_encoding(accept_encoding)
+    body, content_encoding = await _dispatch(simulate_sweep_body, request, fmt, encoding)
+    return _encoded_response(body, content_encoding, fmt)
+
+
+@router.post("/simulate/jobs", response_model=SimulationJobResp, status_code=status.HTTP_202_ACCEPTED)
+def create_simulation_job(request: SimulationRequest) -> SimulationJobResp:
+    # 立即回傳工作 id；用 GET /simulate/jobs/{job_id} 輪詢進度與結果
+    _validate(request)
+    try:
+        job = simulation_jobs.submit(request)
+    except SimulationBusyError as exc:
+        raise _busy(exc)
+    return job.snapshot()
+
+
+@router.get("/simulate/jobs/{job_id}", response_model=SimulationJobResp)
+def get_simulation_job(job_id: str) -> SimulationJobResp:
+    return _job_or_404(simulation_jobs.get(job_id))
+
+
+@router.delete("/simulate/jobs/{job_id}", response_model=SimulationJobResp)
+def cancel_simulation_job(job_id: str) -> SimulationJobResp:
+    return _job_or_404(simulation_jobs.cancel(job_id))
+
+
+@router.get("/simulate/cache")
+def simulate_cache_stats():
+    return {
+        **simulation_cache_stats(),
+        "userBaselines": user_baseline_cache_stats(),
+        "dispatcher": simulation_dispatcher.stats(),
+        "jobs": simulation_jobs.stats(),
+    }
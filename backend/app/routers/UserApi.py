@@ -22,8 +22,8 @@ router = APIRouter(tags=["user"], prefix="/user")
 
 
 @router.post("/register")
-def register_user(request: UserRegisterReq):
-    success = register_user_service(request)
+async def register_user(request: UserRegisterReq):
+    success = await register_user_service(request)
     if not success:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -33,8 +33,8 @@ def register_user(request: UserRegisterReq):
 
 
 @router.post("/login", response_model=UserLoginResp)
-def login_user(request: UserLoginReq) -> UserLoginResp:
-    user = login_user_service(request)
+async def login_user(request: UserLoginReq) -> UserLoginResp:
+    user = await login_user_service(request)
     if user is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -43,8 +43,8 @@ def login_user(request: UserLoginReq) -> UserLoginResp:
     return user
 
 @router.post("/modify-data")
-def modify_user_data(request: UserModifyDataReq):
-    success = modify_user_data_service(request)
+async def modify_user_data(request: UserModifyDataReq):
+    success = await modify_user_data_service(request)
     if not success:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
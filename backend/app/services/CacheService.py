@@ -0,0 +1,236 @@
+import hashlib
+import json
+import math
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+# 選用：共享快取後端（redis-py 的 asyncio client，任何 Redis 相容的服務都可以）
+try:
+    import redis.asyncio as redis_asyncio
+    from redis import exceptions as redis_exceptions
+except ImportError:  # pragma: no cover - redis 未安裝
+    redis_asyncio = None
+    redis_exceptions = None
+
+
+__all__ = ["LRUCache", "RedisCache", "canonical_hash"]
+
+
+class LRUCache:
+    """
+    執行緒安全的 LRU + TTL 快取：
+    - max_bytes: 所有項目大小總和的上限，超過就從最久沒用的項目開始淘汰
+    - ttl_seconds: 項目存活時間（None 表示不過期）
+    - sizeof: 計算項目大小的函式（預設 len，適合 bytes）
+    """
+
+    def __init__(
+        self,
+        max_bytes: int,
+        ttl_seconds: Optional[float] = None,
+        sizeof: Callable[[Any], int] = len,
+    ) -> None:
+        self.max_bytes = max(int(max_bytes), 0)
+        self.ttl_seconds = ttl_seconds
+        self._sizeof = sizeof
+        self._entries: "OrderedDict[Hashable, Tuple[float, int, Any]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, _, value = entry
+            if expires_at < time.monotonic():
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        size = int(self._sizeof(value))
+        if size > self.max_bytes:
+            # 單一項目就超過預算，不快取
+            return
+        expires_at = time.monotonic() + self.ttl_seconds if self.ttl_seconds is not None else math.inf
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (expires_at, size, value)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def invalidate(self, key: Hashable) -> None:
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+    def _remove(self, key: Hashable) -> None:
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+
+class RedisCache:
+    """
+    多個 worker 共用的快取（Redis 相容服務），介面與 LRUCache 相同但為 async，值為 bytes：
+    - TTL 由 SET ... EX 負責；LRU 淘汰交給伺服器（maxmemory-policy allkeys-lru）
+    - 連線或指令失敗視為未命中，呼叫端退回資料庫，不讓快取故障變成請求失敗
+    """
+
+    def __init__(self, url: str, ttl_seconds: Optional[float] = None, prefix: str = "") -> None:
+        if redis_asyncio is None:
+            raise RuntimeError("RedisCache requires the 'redis' package.")
+        self.ttl_seconds = ttl_seconds
+        self.prefix = prefix
+        self._client = redis_asyncio.Redis.from_url(url)
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    async def get(self, key: Hashable) -> Optional[bytes]:
+        try:
+            value = await self._client.get(f"{self.prefix}{key}")
+        except Exception as exc:
+            self._failed(exc)
+            self.misses += 1
+            return None
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return value
+
+    async def set(self, key: Hashable, value: bytes) -> None:
+        ttl = int(math.ceil(self.ttl_seconds)) if self.ttl_seconds else None
+        try:
+            await self._client.set(f"{self.prefix}{key}", value, ex=ttl)
+        except Exception as exc:
+            self._failed(exc)
+
+    async def invalidate(self, key: Hashable) -> None:
+        try:
+            await self._client.delete(f"{self.prefix}{key}")
+        except Exception as exc:
+            self._failed(exc)
+
+    # 世代（generation）：資料來源寫入後 bump，讀取端在查資料庫之前記下世代，
+    # 寫回快取時用 set_if_generation，期間有人寫入就不寫回，避免把舊資料存滿一個 TTL。
+    # 世代取自全域遞增的 gen-clock，每個 key 的世代與快取項目一樣有 TTL；
+    # 過期（沒有紀錄）的 key 世代視為目前的 gen-clock，不會與之前發出的世代誤判為相同
+    async def generation(self, key: Hashable) -> Optional[int]:
+        """目前的世代；失敗時回傳 None（呼叫端不應寫回快取）"""
+        try:
+            value, clock = await self._client.mget(self._generation_key(key), self._clock_key())
+        except Exception as exc:
+            self._failed(exc)
+            return None
+        return self._current_generation(value, clock)
+
+    async def bump(self, key: Hashable) -> None:
+        ttl = int(math.ceil(self.ttl_seconds)) if self.ttl_seconds else None
+        try:
+            generation = await self._client.incr(self._clock_key())
+            await self._client.set(self._generation_key(key), generation, ex=ttl)
+        except Exception as exc:
+            self._failed(exc)
+
+    async def set_if_generation(self, key: Hashable, value: bytes, generation: int) -> bool:
+        """世代仍是 generation 時才寫入（WATCH + MULTI）；回傳是否寫入"""
+        ttl = int(math.ceil(self.ttl_seconds)) if self.ttl_seconds else None
+        generation_key = self._generation_key(key)
+        try:
+            async with self._client.pipeline(transaction=True) as pipe:
+                await pipe.watch(generation_key, self._clock_key())
+                current, clock = await pipe.mget(generation_key, self._clock_key())
+                if self._current_generation(current, clock) != generation:
+                    await pipe.unwatch()
+                    return False
+                pipe.multi()
+                pipe.set(f"{self.prefix}{key}", value, ex=ttl)
+                await pipe.execute()
+            return True
+        except redis_exceptions.WatchError:
+            return False
+        except Exception as exc:
+            self._failed(exc)
+            return False
+
+    def _generation_key(self, key: Hashable) -> str:
+        return f"{self.prefix}gen:{key}"
+
+    def _clock_key(self) -> str:
+        return f"{self.prefix}gen-clock"
+
+    @staticmethod
+    def _current_generation(value: Optional[bytes], clock: Optional[bytes]) -> int:
+        if value is not None:
+            return int(value)
+        return int(clock) if clock is not None else 0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "errors": self.errors,
+        }
+
+    async def close(self) -> None:
+        await self._client.aclose()
+
+    def _failed(self, exc: Exception) -> None:
+        self.errors += 1
+        print(f"Cache backend error: {exc}")
+
+
+def _normalize(value: Any) -> Any:
+    # dict 依 key 排序；float 統一成 12 位有效數字（-0.0 → 0.0），整數值的 float 與 int 視為相同
+    if isinstance(value, dict):
+        return {str(key): _normalize(value[key]) for key in sorted(value, key=str)}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(item) for item in value]
+    if isinstance(value, float):
+        if not math.isfinite(value):
+            return repr(value)
+        value = float(f"{value:.12g}") + 0.0
+        return int(value) if value.is_integer() else value
+    return value
+
+
+def canonical_hash(payload: Any) -> str:
+    """與欄位順序、浮點數表示方式無關的內容雜湊（sha256 hex）"""
+    canonical = json.dumps(_normalize(payload), sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
@@ -1,8 +1,13 @@
-from typing import Optional
+import hashlib
+import os
+from typing import Any, Dict, Optional, Tuple
+
+from dotenv import load_dotenv
 
 try:
     from ..models.FinancialSettingReq import FinancialSettingReq
     from ..models.FinancialSettingResp import FinancialSettingResp
+    from .CacheService import LRUCache, RedisCache
     from ..database.FinancialSettingDB import (
         update_financial_setting as db_update_financial_setting,
         get_financial_setting as db_get_financial_setting,
@@ -10,14 +15,115 @@ try:
 except ImportError:  # Allow running without package context
     from models.FinancialSettingReq import FinancialSettingReq  # type: ignore
     from models.FinancialSettingResp import FinancialSettingResp  # type: ignore
+    from services.CacheService import LRUCache, RedisCache  # type: ignore
     from database.FinancialSettingDB import (  # type: ignore
         update_financial_setting as db_update_financial_setting,
         get_financial_setting as db_get_financial_setting,
     )
 
 
-def update_financial_setting(request: FinancialSettingReq) -> bool:
-    return db_update_financial_setting(
+load_dotenv()
+
+# 財務設定讀取快取：以 user_id 為 key，存序列化後的回應；儲存設定時失效，TTL 只是保險
+FINANCIAL_SETTING_CACHE_TTL_SECONDS = float(os.getenv("FINANCIAL_SETTING_CACHE_TTL_SECONDS", "300"))
+FINANCIAL_SETTING_CACHE_MAX_BYTES = int(os.getenv("FINANCIAL_SETTING_CACHE_MAX_BYTES", str(4 * 1024 * 1024)))
+# 設定後改用共享快取（例如 redis://localhost:6379/0），多個 worker 看到同一份、失效也同步；需要 redis 套件
+FINANCIAL_SETTING_CACHE_URL = os.getenv("FINANCIAL_SETTING_CACHE_URL")
+# 行程內快取最多記住幾個使用者的寫入世代（超過依 LRU 淘汰）
+FINANCIAL_SETTING_GENERATION_MAX_ENTRIES = int(os.getenv("FINANCIAL_SETTING_GENERATION_MAX_ENTRIES", "10000"))
+
+_local_cache = LRUCache(
+    max_bytes=FINANCIAL_SETTING_CACHE_MAX_BYTES,
+    ttl_seconds=FINANCIAL_SETTING_CACHE_TTL_SECONDS,
+)
+# 每個 user_id 的寫入世代（只用於行程內快取；共享快取的世代存在 Redis）。
+# 世代取自全域遞增的時鐘，不會重複；沒有紀錄（從沒寫過或已被淘汰）的使用者世代視為目前的時鐘，
+# 因此淘汰只會讓少數讀取不寫回快取，不會讓舊資料被寫回
+_local_generations = LRUCache(
+    max_bytes=FINANCIAL_SETTING_GENERATION_MAX_ENTRIES,
+    ttl_seconds=FINANCIAL_SETTING_CACHE_TTL_SECONDS,
+    sizeof=lambda _generation: 1,
+)
+_local_generation_clock = 0
+
+
+def _shared_cache_from_env() -> Optional[RedisCache]:
+    if not FINANCIAL_SETTING_CACHE_URL:
+        return None
+    try:
+        return RedisCache(
+            FINANCIAL_SETTING_CACHE_URL,
+            ttl_seconds=FINANCIAL_SETTING_CACHE_TTL_SECONDS,
+            prefix="financial-setting:",
+        )
+    except Exception as exc:
+        print(f"Error creating shared cache, falling back to in-process cache: {exc}")
+        return None
+
+
+_shared_cache = _shared_cache_from_env()
+
+
+async def _cache_get(user_id: int) -> Optional[bytes]:
+    if _shared_cache is not None:
+        return await _shared_cache.get(user_id)
+    return _local_cache.get(user_id)
+
+
+def _local_generation(user_id: int) -> int:
+    generation = _local_generations.get(user_id)
+    return _local_generation_clock if generation is None else generation
+
+
+async def _cache_generation(user_id: int) -> Optional[int]:
+    if _shared_cache is not None:
+        return await _shared_cache.generation(user_id)
+    return _local_generation(user_id)
+
+
+async def _bump_generation(user_id: int) -> None:
+    global _local_generation_clock
+    if _shared_cache is not None:
+        await _shared_cache.bump(user_id)
+    else:
+        _local_generation_clock += 1
+        _local_generations.set(user_id, _local_generation_clock)
+
+
+async def _cache_set(user_id: int, body: bytes, generation: Optional[int]) -> None:
+    # 讀資料庫期間有寫入（世代變了）就不寫回：那份資料可能是寫入前讀到的舊設定
+    if generation is None:
+        return
+    if _shared_cache is not None:
+        await _shared_cache.set_if_generation(user_id, body, generation)
+    elif _local_generation(user_id) == generation:
+        _local_cache.set(user_id, body)
+
+
+async def invalidate_financial_setting(user_id: int) -> None:
+    if _shared_cache is not None:
+        await _shared_cache.invalidate(user_id)
+    else:
+        _local_cache.invalidate(user_id)
+
+
+def financial_setting_cache_stats() -> Dict[str, Any]:
+    if _shared_cache is not None:
+        return {"backend": "redis", **_shared_cache.stats()}
+    return {"backend": "memory", **_local_cache.stats()}
+
+
+async def close_financial_setting_cache() -> None:
+    if _shared_cache is not None:
+        await _shared_cache.close()
+
+
+def etag_for(body: bytes) -> str:
+    return '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+
+async def update_financial_setting(request: FinancialSettingReq) -> bool:
+    success = await db_update_financial_setting(
         user_id=int(request.user_id),
         monthlyIncome=float(request.monthlyIncome),
         totalAsset=float(request.totalAsset),
@@ -26,9 +132,37 @@ def update_financial_setting(request: FinancialSettingReq) -> bool:
         riskMode=str(request.riskMode),
         fixedReturn=float(request.fixedReturn) if request.fixedReturn is not None else None,
     )
+    # 寫入之後先 bump 世代再失效：寫入前開始的讀取不會把舊設定寫回快取，
+    # 在 bump 之前就寫回的舊設定則被這次失效清掉
+    await _bump_generation(int(request.user_id))
+    await invalidate_financial_setting(int(request.user_id))
+    return success
+
+
+async def get_financial_setting_body(user_id: int) -> Optional[Tuple[bytes, str]]:
+    """
+    read-through：先查快取，沒有才查 MongoDB 並寫回快取。
+    回傳 (JSON 內容, ETag)；設定不存在或欄位不完整時回傳 None（不快取）。
+    """
+    body = await _cache_get(user_id)
+    if body is None:
+        generation = await _cache_generation(user_id)
+        setting = _to_response(await db_get_financial_setting(user_id))
+        if setting is None:
+            return None
+        body = setting.model_dump_json().encode("utf-8")
+        await _cache_set(user_id, body, generation)
+    return body, etag_for(body)
+
+
+async def get_financial_setting(user_id: int) -> Optional[FinancialSettingResp]:
+    cached = await get_financial_setting_body(user_id)
+    if cached is None:
+        return None
+    return FinancialSettingResp.model_validate_json(cached[0])
+
 
-def get_financial_setting(user_id: int) -> Optional[FinancialSettingResp]:
-    record = db_get_financial_setting(user_id)
+def _to_response(record: Optional[Dict[str, Any]]) -> Optional[FinancialSettingResp]:
     if not record:
         return None
 
@@ -0,0 +1,139 @@
+import asyncio
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterator, Optional
+
+from dotenv import load_dotenv
+
+
+__all__ = ["SimulationBusyError", "SimulationDispatcher", "SimulationStream", "simulation_dispatcher"]
+
+load_dotenv()
+
+# 同時執行的模擬數（專用執行緒，不佔用 FastAPI 預設的 threadpool）
+SIMULATION_THREADS = int(os.getenv("SIMULATION_THREADS", "2"))
+# 執行中之外最多還能排隊幾個；超過就直接拒絕
+SIMULATION_QUEUE_LIMIT = int(os.getenv("SIMULATION_QUEUE_LIMIT", "8"))
+SIMULATION_RETRY_AFTER_SECONDS = int(os.getenv("SIMULATION_RETRY_AFTER_SECONDS", "2"))
+
+
+class SimulationBusyError(Exception):
+    """模擬佇列已滿"""
+
+    def __init__(self, retry_after: int) -> None:
+        super().__init__("Simulation queue is full.")
+        self.retry_after = retry_after
+
+
+class SimulationDispatcher:
+    """
+    有上限的 CPU 工作派送器：
+    - 最多 workers 個模擬同時執行，另外最多 queue_limit 個排隊
+    - 名額用完時 run() 立刻丟出 SimulationBusyError，而不是讓延遲無限制地累積
+    """
+
+    def __init__(self, workers: int, queue_limit: int, retry_after: int) -> None:
+        self.workers = max(int(workers), 1)
+        self.queue_limit = max(int(queue_limit), 0)
+        self.retry_after = retry_after
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="simulation")
+        self._slots = threading.BoundedSemaphore(self.workers + self.queue_limit)
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self.rejected = 0
+
+    async def run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        self._acquire()
+        future = self._executor.submit(fn, *args)
+        # 名額在工作真正結束時才歸還（即使呼叫端已經斷線、await 被取消）
+        future.add_done_callback(self._release)
+        return await asyncio.wrap_future(future)
+
+    def stream(self, iterator: Iterator[Any]) -> "SimulationStream":
+        """
+        在專用執行緒上逐項取出 iterator（例如逐情境的模擬結果），整個串流只佔一個名額。
+        名額在這裡（回應開始前）就取得，佇列滿時呼叫端還來得及回 503。
+        回應可能在開始讀取前就因為斷線而放棄，所以呼叫端必須保證呼叫 aclose()（例如在回應的 finally 裡）。
+        """
+        self._acquire()
+        return SimulationStream(self, iterator)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "queue_limit": self.queue_limit,
+                "in_flight": self._in_flight,
+                "rejected": self.rejected,
+            }
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _acquire(self) -> None:
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise SimulationBusyError(self.retry_after)
+        with self._lock:
+            self._in_flight += 1
+
+    def _release(self, _future: Any) -> None:
+        with self._lock:
+            self._in_flight -= 1
+        self._slots.release()
+
+
+class SimulationStream:
+    """
+    SimulationDispatcher.stream() 回傳的 async iterator：
+    - 取完或 aclose() 時關閉 iterator 並歸還名額（只做一次，從沒開始讀取也一樣）
+    - 還有一項在執行緒上計算時，等那一項真正結束才關閉、歸還
+    """
+
+    _done = object()
+
+    def __init__(self, dispatcher: SimulationDispatcher, iterator: Iterator[Any]) -> None:
+        self._dispatcher = dispatcher
+        self._iterator = iterator
+        self._pending: Optional[Future] = None
+        self._closed = False
+
+    def __aiter__(self) -> "SimulationStream":
+        return self
+
+    async def __anext__(self) -> Any:
+        if self._closed:
+            raise StopAsyncIteration
+        self._pending = self._dispatcher._executor.submit(next, self._iterator, self._done)
+        item = await asyncio.wrap_future(self._pending)
+        if item is self._done:
+            await self.aclose()
+            raise StopAsyncIteration
+        return item
+
+    async def aclose(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        pending = self._pending
+        if pending is not None and not pending.done():
+            pending.add_done_callback(lambda _future: self._finish())
+        else:
+            self._finish()
+
+    def _finish(self) -> None:
+        close = getattr(self._iterator, "close", None)
+        try:
+            if close is not None:
+                close()
+        except Exception as exc:
+            print(f"Error closing simulation stream: {exc}")
+        finally:
+            self._dispatcher._release(None)
+
+
+simulation_dispatcher = SimulationDispatcher(
+    SIMULATION_THREADS, SIMULATION_QUEUE_LIMIT, SIMULATION_RETRY_AFTER_SECONDS
+)
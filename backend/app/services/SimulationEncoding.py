@@ -0,0 +1,141 @@
+import gzip
+import json
+import math
+import os
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+from dotenv import load_dotenv
+
+# 以下皆為選用套件：沒有安裝時退回標準函式庫的做法
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson 未安裝
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - msgpack 未安裝
+    msgpack = None
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - brotli 未安裝
+    brotli = None
+
+
+__all__ = [
+    "JSON_MEDIA_TYPE",
+    "MSGPACK_MEDIA_TYPE",
+    "negotiate_format",
+    "negotiate_encoding",
+    "encode_result",
+    "compress",
+    "to_jsonable",
+]
+
+load_dotenv()
+
+JSON_MEDIA_TYPE = "application/json"
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+_MSGPACK_ALIASES = ("application/msgpack", "application/x-msgpack", "application/vnd.msgpack")
+
+# 小於這個大小的回應不壓縮（壓縮的固定成本大於省下的傳輸）
+SIMULATION_COMPRESS_MIN_BYTES = int(os.getenv("SIMULATION_COMPRESS_MIN_BYTES", "1024"))
+GZIP_LEVEL = 1  # 浮點數文字的壓縮率在各等級差不多（約 50%），用最快的等級
+BROTLI_QUALITY = 5
+
+
+def _accepted(header: str) -> Dict[str, float]:
+    # "application/msgpack;q=0.9, application/json" → {"application/msgpack": 0.9, "application/json": 1.0}
+    accepted: Dict[str, float] = {}
+    for part in (header or "").split(","):
+        token, *params = [item.strip() for item in part.split(";")]
+        if not token:
+            continue
+        q = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        accepted[token.lower()] = q
+    return accepted
+
+
+def negotiate_format(accept: str) -> str:
+    """依 Accept 選擇 "msgpack" 或 "json"（msgpack 未安裝時一律 json）"""
+    if msgpack is None:
+        return "json"
+    accepted = _accepted(accept)
+    msgpack_q = max((accepted.get(alias, 0.0) for alias in _MSGPACK_ALIASES), default=0.0)
+    json_q = max(accepted.get(JSON_MEDIA_TYPE, 0.0), accepted.get("*/*", 0.0))
+    return "msgpack" if msgpack_q > 0.0 and msgpack_q >= json_q else "json"
+
+
+def negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    """依 Accept-Encoding 選擇 "br"（有安裝 brotli 時優先）、"gzip" 或 None"""
+    accepted = _accepted(accept_encoding)
+    if brotli is not None and accepted.get("br", 0.0) > 0.0:
+        return "br"
+    if accepted.get("gzip", 0.0) > 0.0:
+        return "gzip"
+    return None
+
+
+def to_jsonable(value: Any) -> Any:
+    """
+    把結果中的 numpy 陣列轉成 list（給標準 json 與 pydantic 使用）。
+    NaN / ±inf 轉成 None，與 orjson 的輸出（null）一致，標準 json 的 allow_nan=False 也不會失敗。
+    """
+    if isinstance(value, np.ndarray):
+        if value.dtype.kind == "f" and not np.isfinite(value).all():
+            return np.where(np.isfinite(value), value, None).tolist()
+        return value.tolist()
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    if isinstance(value, dict):
+        return {key: to_jsonable(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [to_jsonable(item) for item in value]
+    return value
+
+
+def _to_msgpack_columns(value: Any) -> Any:
+    # 逐月序列轉成 float32 little-endian 的原始 bytes（前端可直接 new Float32Array(buffer)）
+    if isinstance(value, np.ndarray):
+        return value.astype("<f4").tobytes()
+    if isinstance(value, dict):
+        return {key: _to_msgpack_columns(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_to_msgpack_columns(item) for item in value]
+    return value
+
+
+def encode_result(result: Dict[str, Any], fmt: str = "json") -> bytes:
+    """
+    序列化模擬結果（lineChart 的序列為 numpy 陣列）：
+    - "json"：有 orjson 時直接序列化 numpy 陣列，不經過 .tolist()；否則退回標準 json
+      （兩者都把 NaN / ±inf 輸出成 null）
+    - "msgpack"：欄位結構與 JSON 相同，序列改為 float32 的 bytes
+    """
+    if fmt == "msgpack":
+        return msgpack.packb(_to_msgpack_columns(result), use_bin_type=True)
+    if orjson is not None:
+        return orjson.dumps(result, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(
+        to_jsonable(result),
+        ensure_ascii=False,
+        allow_nan=False,
+        separators=(",", ":"),
+    ).encode("utf-8")
+
+
+def compress(body: bytes, encoding: Optional[str]) -> Tuple[bytes, Optional[str]]:
+    """壓縮回應內容，回傳 (內容, 實際使用的 Content-Encoding)；太小的內容不壓縮"""
+    if encoding is None or len(body) < SIMULATION_COMPRESS_MIN_BYTES:
+        return body, None
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY), "br"
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0), "gzip"
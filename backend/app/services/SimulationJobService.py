@@ -0,0 +1,169 @@
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional
+
+from dotenv import load_dotenv
+
+try:
+    from ..models.SimulationReq import SimulationRequest
+    from .SimulationDispatcher import SimulationBusyError
+    from .SimulationService import simulate_financial_plan
+except ImportError:  # Allow running without package context
+    from models.SimulationReq import SimulationRequest  # type: ignore
+    from services.SimulationDispatcher import SimulationBusyError  # type: ignore
+    from services.SimulationService import simulate_financial_plan  # type: ignore
+
+
+__all__ = ["JobCancelled", "SimulationJob", "SimulationJobStore", "simulation_jobs"]
+
+load_dotenv()
+
+# 背景工作同時執行數、最多未完成（排隊 + 執行中）工作數
+SIMULATION_JOB_WORKERS = int(os.getenv("SIMULATION_JOB_WORKERS", "2"))
+SIMULATION_JOB_LIMIT = int(os.getenv("SIMULATION_JOB_LIMIT", "16"))
+# 結束（完成 / 失敗 / 取消）的工作保留多久可以查詢
+SIMULATION_JOB_TTL_SECONDS = float(os.getenv("SIMULATION_JOB_TTL_SECONDS", "600"))
+SIMULATION_RETRY_AFTER_SECONDS = int(os.getenv("SIMULATION_RETRY_AFTER_SECONDS", "2"))
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED = (DONE, FAILED, CANCELLED)
+
+
+class JobCancelled(Exception):
+    """工作已被取消（由進度回呼丟出，中止模擬）"""
+
+
+@dataclass
+class SimulationJob:
+    job_id: str
+    status: str = QUEUED
+    progress: float = 0.0
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+    cancel_requested: bool = False
+    future: Optional[Future] = field(default=None, repr=False)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.job_id,
+            "status": self.status,
+            "progress": round(self.progress, 1),
+            "result": self.result,
+            "error": self.error,
+        }
+
+
+class SimulationJobStore:
+    """
+    非同步模擬工作：
+    - submit() 立即回傳工作 id，模擬在背景執行緒中進行
+    - 進度由 run_paths 每個月份區塊回報（0–100）
+    - cancel() 讓下一次進度回報丟出 JobCancelled，模擬在區塊邊界停下
+    - 結束的工作在 ttl_seconds 之後自動清除
+    """
+
+    def __init__(self, workers: int, limit: int, ttl_seconds: float, retry_after: int) -> None:
+        self.limit = max(int(limit), 1)
+        self.ttl_seconds = ttl_seconds
+        self.retry_after = retry_after
+        self._executor = ThreadPoolExecutor(max_workers=max(int(workers), 1), thread_name_prefix="simulation-job")
+        self._jobs: Dict[str, SimulationJob] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, request: SimulationRequest) -> SimulationJob:
+        with self._lock:
+            self._purge()
+            pending = sum(1 for job in self._jobs.values() if job.status not in FINISHED)
+            if pending >= self.limit:
+                raise SimulationBusyError(self.retry_after)
+            job = SimulationJob(job_id=uuid.uuid4().hex)
+            self._jobs[job.job_id] = job
+        job.future = self._executor.submit(self._run, job, request)
+        return job
+
+    def get(self, job_id: str) -> Optional[SimulationJob]:
+        with self._lock:
+            self._purge()
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> Optional[SimulationJob]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.status in FINISHED:
+                return job
+            job.cancel_requested = True
+            # 還沒開始的工作直接取消；執行中的在下一個區塊邊界停下
+            if job.future is not None and job.future.cancel():
+                self._finish(job, CANCELLED)
+            return job
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            counts = {status: 0 for status in (QUEUED, RUNNING) + FINISHED}
+            for job in self._jobs.values():
+                counts[job.status] += 1
+            return {"limit": self.limit, **counts}
+
+    def shutdown(self) -> None:
+        with self._lock:
+            for job in self._jobs.values():
+                job.cancel_requested = True
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _run(self, job: SimulationJob, request: SimulationRequest) -> None:
+        with self._lock:
+            if job.cancel_requested:
+                self._finish(job, CANCELLED)
+                return
+            job.status = RUNNING
+
+        def progress(done: int, total: int) -> None:
+            if job.cancel_requested:
+                raise JobCancelled()
+            job.progress = 100.0 * done / total if total else 100.0
+
+        # 多個情境共用同一次 run_paths，回報的是該次批次的進度；最後固定設為 100
+        try:
+            result = simulate_financial_plan(request, progress)
+        except JobCancelled:
+            with self._lock:
+                self._finish(job, CANCELLED)
+            return
+        except Exception as exc:
+            with self._lock:
+                job.error = str(exc)
+                self._finish(job, FAILED)
+            return
+        with self._lock:
+            job.result = result
+            job.progress = 100.0
+            self._finish(job, DONE)
+
+    def _finish(self, job: SimulationJob, status: str) -> None:
+        job.status = status
+        job.finished_at = time.time()
+
+    def _purge(self) -> None:
+        deadline = time.time() - self.ttl_seconds
+        expired = [
+            job_id
+            for job_id, job in self._jobs.items()
+            if job.finished_at is not None and job.finished_at < deadline
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+
+simulation_jobs = SimulationJobStore(
+    SIMULATION_JOB_WORKERS, SIMULATION_JOB_LIMIT, SIMULATION_JOB_TTL_SECONDS, SIMULATION_RETRY_AFTER_SECONDS
+)
@@ -0,0 +1,47 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+from dotenv import load_dotenv
+
+
+__all__ = ["get_pool", "pool_workers", "shutdown_pool", "PARALLEL_MIN_WORK"]
+
+load_dotenv()
+
+# worker 數（<= 1 表示不開 process pool，全部在目前行程內計算）
+SIMULATION_WORKERS = int(os.getenv("SIMULATION_WORKERS", "0"))
+# 情境數 × 路徑數小於這個門檻的請求直接在行程內計算，不值得付跨行程的成本
+PARALLEL_MIN_WORK = int(os.getenv("SIMULATION_PARALLEL_MIN_WORK", "40000"))
+
+_pool: Optional[ProcessPoolExecutor] = None
+_lock = threading.Lock()
+
+
+def pool_workers() -> int:
+    return SIMULATION_WORKERS
+
+
+def get_pool() -> Optional[ProcessPoolExecutor]:
+    """常駐的 process pool（第一次使用時才建立）；未啟用時回傳 None"""
+    global _pool
+    if SIMULATION_WORKERS <= 1:
+        return None
+    with _lock:
+        if _pool is None:
+            # 用 spawn 而不是 fork：伺服器行程裡有其他執行緒，fork 不安全
+            _pool = ProcessPoolExecutor(
+                max_workers=SIMULATION_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _pool
+
+
+def shutdown_pool() -> None:
+    global _pool
+    with _lock:
+        if _pool is not None:
+            _pool.shutdown(cancel_futures=True)
+            _pool = None
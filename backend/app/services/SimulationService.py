@@ -1,19 +1,91 @@
+import itertools
+import os
+import warnings
 from dataclasses import dataclass
-from typing import Any, Dict, List, Literal, Optional, Tuple
+from functools import lru_cache
+from typing import Any, Callable, Dict, Hashable, Iterator, List, Literal, Optional, Sequence, Tuple
 
 import numpy as np
+from dotenv import load_dotenv
 
 try:
     # 假設這是從 SimulationReq 載入的原始模型定義
-    from ..models.SimulationReq import Event, Expenses, Scenario, SimulationRequest
+    from ..models.SimulationReq import (
+        Event,
+        Expenses,
+        LineChartOptions,
+        Scenario,
+        SimulationRequest,
+        SimulationSweepRequest,
+        SweepGrid,
+    )
+    from .CacheService import LRUCache, canonical_hash
+    from .SimulationEncoding import compress, encode_result, to_jsonable
+    from .SimulationPool import PARALLEL_MIN_WORK, get_pool, pool_workers
 except ImportError:  # Allow running without package context
-    from models.SimulationReq import Event, Expenses, Scenario, SimulationRequest  # type: ignore
-
+    from models.SimulationReq import (  # type: ignore
+        Event,
+        Expenses,
+        LineChartOptions,
+        Scenario,
+        SimulationRequest,
+        SimulationSweepRequest,
+        SweepGrid,
+    )
+    from services.CacheService import LRUCache, canonical_hash  # type: ignore
+    from services.SimulationEncoding import compress, encode_result, to_jsonable  # type: ignore
+    from services.SimulationPool import PARALLEL_MIN_WORK, get_pool, pool_workers  # type: ignore
+
+
+__all__ = [
+    "simulate_financial_plan",
+    "simulate_financial_plan_json",
+    "simulate_financial_plan_body",
+    "cached_simulation_body",
+    "iter_simulation_events",
+    "cached_simulation_json",
+    "simulation_cache_stats",
+    "SOBOL_AVAILABLE",
+    "SimulationMemoryError",
+    "check_memory_budget",
+    "CompiledBaseline",
+    "compile_baseline",
+    "SIMULATION_BATCH_MAX_REQUESTS",
+    "simulate_batch",
+    "simulate_batch_body",
+    "iter_batch_events",
+    "SIMULATION_SWEEP_MAX_POINTS",
+    "sweep_points",
+    "simulate_sweep",
+    "simulate_sweep_body",
+]
 
-__all__ = ["simulate_financial_plan"]
+load_dotenv()
 
 # --- 常數定義 ---
 SIMULATION_MONTHS = 120  # 固定模擬10年（120個月）
+RETURN_BLOCK_MONTHS = 12  # 串流模式下每次生成的月報酬區塊（月數）
+PATH_BLOCK_SIZE = 2048    # 每個路徑區塊有獨立的子亂數流；改變此值會改變同一個 seed 的結果
+SHARED_RETURNS_MAX_BYTES = 8 * 1024 * 1024  # 可共用（快取）的月報酬矩陣大小上限，超過就逐塊生成
+SHARED_RETURNS_CACHE_SIZE = 8               # 最多快取幾組 (market, months, paths, seed) 的月報酬
+
+# 模擬結果快取（序列化後的 JSON bytes）：總大小上限與存活秒數
+SIMULATION_CACHE_MAX_BYTES = int(os.getenv("SIMULATION_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+SIMULATION_CACHE_TTL_SECONDS = float(os.getenv("SIMULATION_CACHE_TTL_SECONDS", "600"))
+
+# 每個請求的引擎記憶體預算（MB）：放不下時縮小月份區塊，最小區塊仍放不下就拒絕；0 表示不限制
+SIMULATION_MEMORY_BUDGET_MB = float(os.getenv("SIMULATION_MEMORY_BUDGET_MB", "512"))
+
+# /simulate/batch 一次最多幾個請求
+SIMULATION_BATCH_MAX_REQUESTS = int(os.getenv("SIMULATION_BATCH_MAX_REQUESTS", "500"))
+
+# /simulate/sweep 的格點數上限
+SIMULATION_SWEEP_MAX_POINTS = int(os.getenv("SIMULATION_SWEEP_MAX_POINTS", "2500"))
+
+# 值為 (序列化後的內容, Content-Encoding)
+_result_cache = LRUCache(
+    SIMULATION_CACHE_MAX_BYTES, SIMULATION_CACHE_TTL_SECONDS, sizeof=lambda entry: len(entry[0])
+)
 
 # --- 新增的顏色配置與輔助函數 ---
 
@@ -44,12 +116,23 @@ def _as_rate(x: Optional[float]) -> Optional[float]:
     # 若已經是 0.0345 這種小數，就保持不變
     return x / 100.0 if abs(x) > 1.0 else x
 
+# scipy 為選用套件：只有 sampling="sobol" 需要
+try:
+    from scipy.special import ndtri
+    from scipy.stats import qmc
+except ImportError:  # pragma: no cover - scipy 未安裝
+    ndtri = qmc = None
+
+SOBOL_AVAILABLE = qmc is not None
+
 # --- 核心數據模型與邏輯 ---
 
 MarketMode = Literal["fixed", "normal"]
+Precision = Literal["float64", "float32"]
+Sampling = Literal["random", "antithetic", "sobol"]
 
 
-@dataclass
+@dataclass(frozen=True)
 class MarketModelCore:
     mode: MarketMode = "fixed"
     profile: Literal["custom", "low_risk", "high_risk"] = "custom"
@@ -59,6 +142,7 @@ class MarketModelCore:
     normal_sigma: float = 0.15                  # 年化波動
     annual_min: Optional[float] = None          # 年化下限（例如 -0.2）
     annual_max: Optional[float] = None          # 年化上限（例如 +0.2）
+    sampling: Sampling = "random"               # 變異數縮減：random / antithetic / sobol
 
 
 @dataclass
@@ -95,13 +179,52 @@ def gen_monthly_returns(
     market: MarketModelCore,
     months: int,
     paths: int,
-    rng: Optional[np.random.Generator] = None,
+    seed: Optional[int] = None,
 ) -> np.ndarray:
-    rng = rng or np.random.default_rng()
+    """回傳 shape=(paths, months) 的月報酬矩陣（與 iter_monthly_returns 逐塊生成的結果相同）"""
+    blocks = [block for _, block in iter_monthly_returns(market, months, paths, seed, months)]
+    return np.concatenate(blocks, axis=0).T
+
+
+def path_block_bounds(paths: int, path_blocks: Optional[Tuple[int, int]] = None) -> List[Tuple[int, int]]:
+    """路徑區塊 [first, last) 各自涵蓋的路徑範圍 (start, stop)；None 表示全部區塊"""
+    n_blocks = -(-paths // PATH_BLOCK_SIZE)
+    first, last = path_blocks if path_blocks is not None else (0, n_blocks)
+    return [
+        (block * PATH_BLOCK_SIZE, min((block + 1) * PATH_BLOCK_SIZE, paths))
+        for block in range(first, last)
+    ]
+
+
+def iter_monthly_returns(
+    market: MarketModelCore,
+    months: int,
+    paths: int,
+    seed: Optional[int] = None,
+    block_months: int = RETURN_BLOCK_MONTHS,
+    path_blocks: Optional[Tuple[int, int]] = None,
+) -> Iterator[Tuple[int, np.ndarray]]:
+    """
+    以「月份區塊」逐塊生成月報酬，yield (起始月, shape=(區塊月數, 路徑數) 的報酬)。
+    - 路徑每 PATH_BLOCK_SIZE 條為一個區塊，各自使用 SeedSequence(seed).spawn() 的子亂數流，
+      path_blocks=(first, last) 只生成其中幾個區塊（平行運算時各 worker 分頭生成）
+    - 每個區塊內依「月份優先」的順序抽取，因此不論月份區塊大小、不論怎麼切路徑區塊，
+      同一個 seed 得到的報酬都相同
+    - market.sampling 選擇變異數縮減方式（都在對數報酬上做，之後照常套用 annual_min / annual_max）：
+      "antithetic" 每個路徑區塊的後半是前半衝擊的鏡像（mu - sigma * z）；
+      "sobol" 每個路徑區塊是一組 scrambled Sobol 點（每條路徑一個點、每個月一個維度），
+      經反常態 CDF 轉成標準常態（需要 scipy）
+    """
+    block_months = max(int(block_months), 1)
+    bounds = path_block_bounds(paths, path_blocks)
+    width = sum(stop - start for start, stop in bounds)
 
     if market.mode == "fixed":
-        annual_r = np.full((paths, months), market.fixed_annual_return)
-        return annual_to_monthly_r(annual_r)
+        monthly_r = float(annual_to_monthly_r(market.fixed_annual_return))
+        for start in range(0, months, block_months):
+            stop = min(start + block_months, months)
+            yield start, np.full((stop - start, width), monthly_r)
+        return
 
     if market.profile == "low_risk":
         mu_y = 0.04
@@ -119,15 +242,74 @@ def gen_monthly_returns(
 
     mu_m = np.log1p(mu_y) / 12.0
     sigma_m = sigma_y / np.sqrt(12.0)
-    log_returns = rng.normal(mu_m, sigma_m, size=(paths, months))
-    monthly_returns = np.expm1(log_returns)
 
-    if amin is not None:
-        monthly_returns = np.maximum(monthly_returns, annual_to_monthly_r(amin))
-    if amax is not None:
-        monthly_returns = np.minimum(monthly_returns, annual_to_monthly_r(amax))
+    children = np.random.SeedSequence(seed).spawn(-(-paths // PATH_BLOCK_SIZE))
+    first = path_blocks[0] if path_blocks is not None else 0
+    rngs = [np.random.default_rng(children[first + i]) for i in range(len(bounds))]
+    if market.sampling == "sobol":
+        # Sobol 點一次涵蓋所有月份，預先產生每個路徑區塊的標準常態 shape=(months, 區塊路徑數)
+        sobol = [_sobol_normals(rng, stop - start, months) for rng, (start, stop) in zip(rngs, bounds)]
+
+    for start in range(0, months, block_months):
+        stop = min(start + block_months, months)
+        log_returns = np.empty((stop - start, width))
+        offset = 0
+        for i, (rng, (path_start, path_stop)) in enumerate(zip(rngs, bounds)):
+            size = path_stop - path_start
+            columns = slice(offset, offset + size)
+            if market.sampling == "antithetic":
+                shocks = rng.standard_normal((stop - start, -(-size // 2)))
+                log_returns[:, columns] = mu_m + sigma_m * np.concatenate((shocks, -shocks), axis=1)[:, :size]
+            elif market.sampling == "sobol":
+                log_returns[:, columns] = mu_m + sigma_m * sobol[i][start:stop]
+            else:
+                log_returns[:, columns] = rng.normal(mu_m, sigma_m, size=(stop - start, size))
+            offset += size
+        monthly_returns = np.expm1(log_returns)
+
+        if amin is not None:
+            monthly_returns = np.maximum(monthly_returns, annual_to_monthly_r(amin))
+        if amax is not None:
+            monthly_returns = np.minimum(monthly_returns, annual_to_monthly_r(amax))
+
+        yield start, monthly_returns
+
+
+def _sobol_normals(rng: np.random.Generator, paths: int, months: int) -> np.ndarray:
+    """scrambled Sobol 點經反常態 CDF 轉成的標準常態，shape=(months, paths)"""
+    if not SOBOL_AVAILABLE:
+        raise RuntimeError("sampling='sobol' requires scipy")
+    sampler = qmc.Sobol(d=months, scramble=True, rng=rng)
+    with warnings.catch_warnings():
+        # 路徑數不是 2 的次方時 scipy 會提醒平衡性較差，最後一個路徑區塊可能如此
+        warnings.simplefilter("ignore", UserWarning)
+        points = sampler.random(paths)
+    eps = np.finfo(float).eps
+    return ndtri(np.clip(points, eps, 1.0 - eps)).T
+
+
+def shared_monthly_returns(
+    market: MarketModelCore, months: int, paths: int, seed: Optional[int]
+) -> Optional[np.ndarray]:
+    """
+    共用的月報酬矩陣 shape=(months, paths)（月份優先），每組 (market, months, paths, seed)
+    只生成一次，所有情境與後續請求共用（唯讀，market_override 以疊加方式處理，不會改寫）。
+    沒有 seed、固定報酬或矩陣太大時回傳 None，由引擎自行逐塊生成。
+    """
+    if seed is None or is_deterministic(market):
+        return None
+    if months * paths * 8 > SHARED_RETURNS_MAX_BYTES:
+        return None
+    return _shared_monthly_returns(market, months, paths, seed)
 
-    return monthly_returns
+
+@lru_cache(maxsize=SHARED_RETURNS_CACHE_SIZE)
+def _shared_monthly_returns(market: MarketModelCore, months: int, paths: int, seed: int) -> np.ndarray:
+    returns = np.concatenate(
+        [block for _, block in iter_monthly_returns(market, months, paths, seed, months)], axis=0
+    )
+    returns.flags.writeable = False
+    return returns
 
 
 def month_budget_total(expenses: Dict[str, float]) -> float:
@@ -141,14 +323,43 @@ def expense_pie(expenses: Dict[str, float]) -> Dict[str, float]:
     return {key: value / total for key, value in expenses.items()}
 
 
+def quantiles(values: np.ndarray, percentiles: Sequence[float], axis: int = -1) -> np.ndarray:
+    """
+    多分位數 kernel：一次 partition 算出所有 percentiles（0~100），沿 axis 向量化。
+    插值方式與 np.percentile 預設的 linear 相同；float32 的輸入以 float32 計算。
+    回傳 shape=(len(percentiles),) + values 去掉 axis 之後的 shape
+    """
+    values = np.asarray(values)
+    if values.dtype not in (np.float32, np.float64):
+        values = values.astype(float)
+    values = np.moveaxis(values, axis, -1)
+    n = values.shape[-1]
+    virtual = (n - 1) * (np.asarray(percentiles, dtype=float) / 100.0)
+    lower = np.floor(virtual).astype(np.intp)
+    upper = np.minimum(lower + 1, n - 1)
+    gamma = virtual - lower
+
+    partitioned = np.partition(values, np.unique(np.concatenate((lower, upper))), axis=-1)
+    below = np.moveaxis(partitioned[..., lower], -1, 0)
+    above = np.moveaxis(partitioned[..., upper], -1, 0)
+    gamma = gamma.reshape((-1,) + (1,) * (below.ndim - 1))
+
+    # 與 numpy 的 _lerp 相同：t >= 0.5 時從上界回推，減少捨入誤差
+    diff = above - below
+    return np.where(gamma >= 0.5, above - diff * (1.0 - gamma), below + diff * gamma)
+
+
+BOX_PERCENTILES = (5, 25, 50, 75, 95)
+
+
 def box_stats(values: np.ndarray) -> Dict[str, float]:
-    return {
-        "p05": float(np.percentile(values, 5)),
-        "p25": float(np.percentile(values, 25)),
-        "p50": float(np.percentile(values, 50)),
-        "p75": float(np.percentile(values, 75)),
-        "p95": float(np.percentile(values, 95)),
-    }
+    stats = quantiles(values, BOX_PERCENTILES)
+    return {f"p{q:02d}": float(value) for q, value in zip(BOX_PERCENTILES, stats)}
+
+
+def percentile_key(q: float) -> str:
+    # 5 → "p05"、10 → "p10"、2.5 → "p2.5"
+    return f"p{int(q):02d}" if float(q).is_integer() else f"p{q:g}"
 
 
 def realized_cagr(first: float, last: float, months: int) -> float:
@@ -166,6 +377,786 @@ def monthly_saving_rate(income: float, expenses: float) -> float:
     return max(income - expenses, 0.0) / income
 
 
+@dataclass
+class EventSchedule:
+    """
+    編譯後的事件表：每個欄位都是長度 months 的陣列，月份迴圈只需要做陣列運算。
+    第 idx 個月的事件在該月投資/現金更新之後生效（market_override 除外，它直接覆蓋該月報酬）。
+    """
+    cash_out: np.ndarray         # 當月一次性現金流出（expense）
+    income_mul: np.ndarray       # 收入乘數：income = income * income_mul + income_add
+    income_add: np.ndarray       # 收入加數
+    alpha_delta: np.ndarray      # 投資比例變動：alpha = clip(alpha + alpha_delta, alpha_lower, alpha_upper)
+    alpha_lower: np.ndarray      # 同月多筆依序「加上 delta 再 clamp 到 [0, 1]」，合成後仍是一次加法加一次 clamp；
+    alpha_upper: np.ndarray      # 沒有投資比例事件的月份為 -inf / inf（不 clamp）
+    override_mask: np.ndarray    # 當月報酬是否被 market_override 覆蓋
+    override_return: np.ndarray  # 覆蓋後的月報酬（override_mask 為 False 的月份不使用）
+
+    @classmethod
+    def empty(cls, months: int) -> "EventSchedule":
+        return cls(
+            cash_out=np.zeros(months),
+            income_mul=np.ones(months),
+            income_add=np.zeros(months),
+            alpha_delta=np.zeros(months),
+            alpha_lower=np.full(months, -np.inf),
+            alpha_upper=np.full(months, np.inf),
+            override_mask=np.zeros(months, dtype=bool),
+            override_return=np.zeros(months),
+        )
+
+    def _apply_income(self, month: int, delta: float, relative: bool) -> None:
+        # 依事件順序合成仿射變換：先前的 (mul, add) 之後再套用本事件
+        if relative:
+            self.income_mul[month] *= 1.0 + delta
+            self.income_add[month] *= 1.0 + delta
+        else:
+            self.income_add[month] += delta
+
+    def _apply_alpha(self, month: int, delta: float) -> None:
+        # clip(clip(x + a, l, u) + d, 0, 1) = clip(x + a + d, clip(l + d, 0, 1), clip(u + d, 0, 1))
+        self.alpha_delta[month] += delta
+        self.alpha_lower[month] = min(max(self.alpha_lower[month] + delta, 0.0), 1.0)
+        self.alpha_upper[month] = min(max(self.alpha_upper[month] + delta, 0.0), 1.0)
+
+
+def compile_events(events: Optional[Sequence[Event | EventCore]], months: int) -> EventSchedule:
+    """
+    把情境卡的事件清單編譯成 EventSchedule（每個事件只做 O(1) 次陣列切片，與期間長短無關）：
+    - expense / market_override：有 end_month_idx → 區間內每月都套用一次
+    - income_delta / invest_ratio_delta：沒有 end_month_idx → 永久變動；
+      有 end_month_idx → 暫時變動，結束月的下一個月恢復原值
+    - income_delta：|delta|<1 視為百分比，否則視為金額
+    """
+    schedule = EventSchedule.empty(months)
+    if not events:
+        return schedule
+
+    for event in events:
+        start = event.month_idx
+        end_month_idx = getattr(event, "end_month_idx", None)
+        end = end_month_idx if end_month_idx is not None else start
+        if end < start:
+            end = start
+        if start >= months:
+            continue
+
+        # 1) 區間內每月都扣 or override：expense & market_override
+        if event.type == "expense":
+            if event.amount is not None:
+                schedule.cash_out[start:end + 1] += float(event.amount)
+            continue
+        if event.type == "market_override":
+            if event.amount is not None:
+                # e.amount 視為「這個月的年化報酬」
+                ann = float(event.amount)
+                if abs(ann) > 1.0:
+                    ann /= 100.0
+                schedule.override_mask[start:end + 1] = True
+                schedule.override_return[start:end + 1] = annual_to_monthly_r(ann)
+            continue
+
+        # 2) 永久型變動（沒有 end_month_idx）：delta 為 None 就略過
+        if end_month_idx is None and event.delta is None:
+            continue
+        delta = float(event.delta or 0.0)
+        # 3) 區間型暫時變動：區間結束的下一個月恢復（不要超過模擬範圍）
+        revert_month = end + 1 if end_month_idx is not None and end + 1 < months else None
+
+        if event.type == "income_delta":
+            relative = abs(delta) < 1.0
+            schedule._apply_income(start, delta, relative)
+            if revert_month is not None:
+                # 百分比：income *= (1+d) → 之後 *= 1/(1+d)；金額：income += d → 之後 += -d
+                revert = (1.0 / (1.0 + delta)) - 1.0 if relative else -delta
+                schedule._apply_income(revert_month, revert, relative)
+        elif event.type == "invest_ratio_delta":
+            # 投資比例是加法，反向就是 -d；每一筆之後都 clamp 到 [0, 1]（與逐筆套用相同）
+            schedule._apply_alpha(start, delta)
+            if revert_month is not None:
+                schedule._apply_alpha(revert_month, -delta)
+
+    return schedule
+
+
+@dataclass
+class ScenarioPlan:
+    """
+    批次引擎中的一個情境（scenario 軸上的一列）：
+    收入、支出總額、投資比例與事件都各自獨立，市場報酬則由所有情境共用。
+    """
+    name: str
+    income_monthly: float
+    expenses_monthly: Dict[str, float]
+    invest_ratio: float
+    schedule: Optional[EventSchedule] = None   # compile_events 的結果，None 表示沒有事件
+    initial_assets: float = 0.0
+
+
+LINE_PERCENTILES = (5, 50, 95)  # 折線 + 區間帶固定需要的分位數
+
+# 進度回報：progress(已完成, 總數)；回呼可以丟出例外來中止模擬（例如工作被取消）
+ProgressCallback = Callable[[int, int], None]
+
+
+def is_deterministic(market: MarketModelCore) -> bool:
+    """
+    固定報酬模式下每條路徑都完全相同（目前所有事件都是確定性的），
+    只需要模擬一條路徑再廣播即可。
+    """
+    return market.mode == "fixed"
+
+
+@dataclass
+class BatchResult:
+    percentiles: Tuple[float, ...]             # series 第 0 軸對應的分位數（0~100）
+    series: np.ndarray                         # shape=(len(percentiles), scenarios, months)（或只含 quantile_months）
+    final_sample: np.ndarray                   # 實際模擬的期末資產 shape=(scenarios, 模擬路徑數)
+    paths: int                                 # 對外的路徑數（確定性模式下只模擬 1 條）
+    asset_paths: Optional[np.ndarray] = None   # shape=(scenarios, paths, months)，只有 keep_paths=True 才保留
+    quantile_error: Optional[float] = None     # 自適應模式估計的期末分位數相對標準誤（見 run_paths_adaptive）
+
+    @property
+    def final_assets(self) -> np.ndarray:
+        """期末資產樣本 shape=(scenarios, paths)；確定性模式下為唯讀的廣播 view"""
+        return np.broadcast_to(self.final_sample, (self.final_sample.shape[0], self.paths))
+
+    def final_quantiles(self, percentiles: Sequence[float]) -> np.ndarray:
+        """期末資產的分位數 shape=(len(percentiles), scenarios)，直接用實際模擬的樣本計算"""
+        return quantiles(self.final_sample, percentiles, axis=-1)
+
+    def band(self, q: float) -> np.ndarray:
+        """取出某個分位數的逐月序列，shape=(scenarios, months)"""
+        return self.series[self.percentiles.index(q)]
+
+    @property
+    def med(self) -> np.ndarray:
+        return self.band(50)
+
+    @property
+    def p05(self) -> np.ndarray:
+        return self.band(5)
+
+    @property
+    def p95(self) -> np.ndarray:
+        return self.band(95)
+
+
+def _step_path(
+    initial: np.ndarray, multiplier: np.ndarray, addend: np.ndarray, lower: Optional[np.ndarray] = None,
+    upper: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    """
+    確定性的逐月狀態（收入、投資比例）：x_{t+1} = clip(x_t * multiplier_t + addend_t, lower_t, upper_t)。
+    lower / upper 與 multiplier 同 shape（None 表示不 clamp）；邊界不是 ±inf 的月份即使 addend 為 0 也會計算。
+    回傳 shape=(scenarios, months)，第 t 欄是第 t 個月「套用當月事件之前」的值。
+    只在有事件的月份做運算，其餘月份直接沿用前值。
+    """
+    n_rows, months = multiplier.shape
+    path = np.empty((n_rows, months))
+    current = initial
+    prev = 0
+    active = (multiplier != 1.0).any(axis=0) | (addend != 0.0).any(axis=0)
+    if lower is not None and upper is not None:
+        active |= np.isfinite(lower).any(axis=0) | np.isfinite(upper).any(axis=0)
+    for idx in np.flatnonzero(active):
+        path[:, prev:idx + 1] = current
+        current = current * multiplier[:, idx:idx + 1] + addend[:, idx:idx + 1]
+        if lower is not None and upper is not None:
+            current = np.clip(current, lower[:, idx:idx + 1], upper[:, idx:idx + 1])
+        prev = idx + 1
+    path[:, prev:] = current
+    return path
+
+
+def run_paths_batch(
+    months: int,
+    plans: List[ScenarioPlan],
+    market: MarketModelCore,
+    paths: int,
+    seed: Optional[int] = None,
+    auto_liquidate: bool = True,
+    keep_paths: bool = True,
+    block_months: int = RETURN_BLOCK_MONTHS,
+    percentiles: Sequence[float] = LINE_PERCENTILES,
+    engine: Literal["auto", "loop"] = "auto",
+    returns: Optional[np.ndarray] = None,
+    path_blocks: Optional[Tuple[int, int]] = None,
+    progress: Optional[ProgressCallback] = None,
+    quantile_series: bool = True,
+    dtype: Precision = "float64",
+    quantile_months: Optional[np.ndarray] = None,
+) -> BatchResult:
+    """
+    批次蒙地卡羅模擬：所有情境在同一個月份迴圈內一起推進，狀態 shape=(scenarios, paths)。
+    - keep_paths=False 為串流模式：月報酬每次只生成 block_months 個月，
+      只保留期末資產樣本，不配置完整的 asset_paths
+    - 分位數以月份區塊為單位，用 quantiles() 一次算完整塊；
+      percentiles 可額外要求 p10/p90 等區間帶（P05/P50/P95 一定會算）
+    - 確定性輸入（is_deterministic）只模擬一條路徑，成本與 paths 無關
+    - engine="auto"：現金從不為負（不會觸發自動賣出）的情境用線性遞迴的向量化解，
+      整個月份區塊一次算完；只有會觸發 auto_liquidate 的情境走逐月迴圈。
+      engine="loop" 強制全部走逐月迴圈（參考實作）
+    - returns：預先生成的唯讀月報酬 shape=(months, paths)（見 shared_monthly_returns），
+      None 時依 seed 逐塊生成
+    - path_blocks=(first, last)：只模擬這幾個路徑區塊（平行運算用，見 run_paths_parallel）
+    - progress：每個月份區塊結束時回報 progress(已模擬月數, months)
+    - quantile_series=False：不計算逐月分位數（呼叫端拿 asset_paths 合併後自己算，series 全為 0）
+    - quantile_months：只在這些月份（0 起算、遞增）計算分位數，series 的最後一軸只含這些月份
+    - dtype="float32"：路徑狀態、月報酬區塊與 asset_paths 以 float32 計算與保存（記憶體減半，
+      誤差見 README）；確定性的逐月金額仍以 float64 算好再轉型
+    """
+    n_scenarios = len(plans)
+    total_paths = paths
+    if path_blocks is not None:
+        returns = None
+        paths = sum(stop - start for start, stop in path_block_bounds(total_paths, path_blocks))
+    output_paths = paths
+    if is_deterministic(market):
+        paths = total_paths = 1
+        returns = path_blocks = None
+    ## 月報酬以月份區塊取得，所有情境共用（每塊 shape=(區塊月數, paths)）
+    if returns is not None:
+        block_months = max(int(block_months), 1)
+        return_blocks = (
+            (start, returns[start:start + block_months]) for start in range(0, months, block_months)
+        )
+    else:
+        return_blocks = iter_monthly_returns(
+            market, months, total_paths, seed, block_months, path_blocks
+        )
+
+    # 每個情境的參數排成 (scenarios, 1) 的欄向量，方便和 (scenarios, paths) 的狀態廣播
+    initial_invest_ratio = np.clip(
+        np.array([plan.invest_ratio for plan in plans], dtype=float), 0.0, 1.0
+    )[:, None]
+    initial_assets = np.array([plan.initial_assets for plan in plans], dtype=float)[:, None]
+    base_expense = np.array(
+        [month_budget_total(plan.expenses_monthly) for plan in plans], dtype=float
+    )[:, None]                                                              # 固定月支出
+    income_monthly = np.array([plan.income_monthly for plan in plans], dtype=float)[:, None]
+
+    # 事件表疊成 (scenarios, months)
+    schedules = [plan.schedule or EventSchedule.empty(months) for plan in plans]
+    cash_out = np.stack([sch.cash_out for sch in schedules])
+    income_mul = np.stack([sch.income_mul for sch in schedules])
+    income_add = np.stack([sch.income_add for sch in schedules])
+    alpha_delta = np.stack([sch.alpha_delta for sch in schedules])
+    alpha_lower = np.stack([sch.alpha_lower for sch in schedules])
+    alpha_upper = np.stack([sch.alpha_upper for sch in schedules])
+    override_mask = np.stack([sch.override_mask for sch in schedules])
+    override_return = np.stack([sch.override_return for sch in schedules])
+
+    # ---- 確定性的部分一次算完：投資比與收入只受事件影響，同一情境的所有路徑都相同 ----
+    income = _step_path(income_monthly, income_mul, income_add)                      # I_t
+    alpha = _step_path(initial_invest_ratio, np.ones_like(alpha_delta), alpha_delta, alpha_lower, alpha_upper)  # α_t
+    discretionary = np.maximum(income - base_expense, 0.0) # D_t(月收－月支出)
+    invest_amount = alpha * discretionary                   # 投資金額
+    save_amount = (1.0 - alpha) * discretionary            # 留現金
+
+    # 不觸發自動賣出時的現金：C_{t+1} = C_t + save_t - out_t
+    # 交錯排列後 cumsum，與逐月迴圈的加減順序完全相同
+    initial_cash = initial_assets * (1.0 - initial_invest_ratio)
+    cash_flows = np.empty((n_scenarios, 2 * months + 1))
+    cash_flows[:, :1] = initial_cash
+    cash_flows[:, 1::2] = save_amount
+    cash_flows[:, 2::2] = -cash_out
+    cash_path = np.cumsum(cash_flows, axis=1)[:, 2::2]
+
+    # 現金曾經為負的情境才需要逐月處理自動賣出
+    if engine == "loop":
+        needs_loop = np.ones(n_scenarios, dtype=bool)
+    else:
+        needs_loop = (cash_path < 0.0).any(axis=1) if auto_liquidate else np.zeros(n_scenarios, dtype=bool)
+    loop_rows = np.flatnonzero(needs_loop)
+    vec_rows = np.flatnonzero(~needs_loop)
+
+    portfolio = np.broadcast_to(initial_assets * initial_invest_ratio, (n_scenarios, paths)).astype(dtype)  # P_t
+    loop_cash = np.broadcast_to(initial_cash[loop_rows], (len(loop_rows), paths)).astype(dtype)           # C_t
+    if dtype != "float64":
+        # 逐月金額以 float64 算好再轉型，與 float32 的路徑狀態運算時不會被升回 float64
+        invest_amount, save_amount, cash_path, cash_out, override_return = (
+            array.astype(dtype) for array in (invest_amount, save_amount, cash_path, cash_out, override_return)
+        )
+
+    computed = tuple(sorted(set(LINE_PERCENTILES) | {float(q) for q in percentiles}))
+    series = np.zeros((len(computed), n_scenarios, months if quantile_months is None else len(quantile_months)))
+    # 串流模式只保留 O(paths) 的狀態，不配置 (scenarios, paths, months) 的完整走勢
+    asset_paths = np.zeros((n_scenarios, paths, months), dtype=dtype) if keep_paths else None
+
+    for block_start, block in return_blocks:
+        block = block.astype(dtype, copy=False)
+        block_stop = block_start + len(block)
+        window = slice(block_start, block_stop)
+        # 本區塊每個月的資產，區塊結束時一次計算所有分位數
+        if len(loop_rows):
+            asset_block = np.empty((n_scenarios, len(block), paths), dtype=dtype)
+        else:
+            asset_block = _advance_vectorized(
+                portfolio, vec_rows, block, window,
+                invest_amount, cash_path, override_mask, override_return,
+            )
+
+        if len(vec_rows) and len(loop_rows):
+            asset_block[vec_rows] = _advance_vectorized(
+                portfolio, vec_rows, block, window,
+                invest_amount, cash_path, override_mask, override_return,
+            )
+
+        if len(loop_rows):
+            asset_block[loop_rows] = _advance_loop(
+                portfolio, loop_cash, loop_rows, block, window,
+                invest_amount, save_amount, cash_out, override_mask, override_return,
+                auto_liquidate,
+            )
+
+        if asset_paths is not None:
+            asset_paths[:, :, window] = np.moveaxis(asset_block, 1, 2)
+        if quantile_series and quantile_months is None:
+            series[:, :, window] = quantiles(asset_block, computed, axis=-1)
+        elif quantile_series:
+            # 只算要輸出的月份
+            lo, hi = np.searchsorted(quantile_months, [block_start, block_stop])
+            if hi > lo:
+                local = quantile_months[lo:hi] - block_start
+                series[:, :, lo:hi] = quantiles(asset_block[:, local], computed, axis=-1)
+        if progress is not None:
+            progress(block_stop, months)
+
+    final_cash = np.broadcast_to(cash_path[:, -1:], (n_scenarios, paths)).copy()
+    final_cash[loop_rows] = loop_cash
+
+    if asset_paths is not None and paths != output_paths:
+        asset_paths = np.broadcast_to(asset_paths, (n_scenarios, output_paths, months))
+
+    return BatchResult(
+        percentiles=computed,
+        series=series,
+        final_sample=final_cash + portfolio,
+        paths=output_paths,
+        asset_paths=asset_paths,
+    )
+
+
+class SimulationMemoryError(ValueError):
+    """請求在記憶體預算內無法模擬（即使使用最小的月份區塊）"""
+
+
+def estimate_engine_bytes(
+    n_scenarios: int,
+    paths: int,
+    months: int,
+    block_months: int,
+    dtype: Precision = "float64",
+    keep_paths: bool = False,
+) -> int:
+    """
+    run_paths_batch 的記憶體峰值估計（bytes）：
+    - 路徑狀態（portfolio / cash / 期末現金）：3 × scenarios × paths
+    - 月份區塊的資產、線性遞迴與 partition 的暫存：3 × scenarios × block_months × paths
+    - 月報酬區塊（float64 生成 + 累積成長率等暫存）：4 × block_months × paths（float64）
+    - keep_paths：完整走勢 scenarios × paths × months，合併時再一份
+    """
+    itemsize = np.dtype(dtype).itemsize
+    total = itemsize * n_scenarios * paths * (3 + 3 * block_months) + 8 * 4 * block_months * paths
+    if keep_paths:
+        total += 2 * itemsize * n_scenarios * paths * months
+    return int(total)
+
+
+def _memory_budget_bytes() -> Optional[int]:
+    return int(SIMULATION_MEMORY_BUDGET_MB * 1024 * 1024) if SIMULATION_MEMORY_BUDGET_MB > 0 else None
+
+
+def plan_block_months(
+    n_scenarios: int,
+    paths: int,
+    months: int,
+    dtype: Precision = "float64",
+    keep_paths: bool = False,
+) -> int:
+    """
+    在 SIMULATION_MEMORY_BUDGET_MB 內挑最大的月份區塊（最多 RETURN_BLOCK_MONTHS）；
+    連 1 個月的區塊都放不下時丟出 SimulationMemoryError。
+    """
+    budget = _memory_budget_bytes()
+    if budget is None:
+        return RETURN_BLOCK_MONTHS
+    for block_months in range(RETURN_BLOCK_MONTHS, 0, -1):
+        if estimate_engine_bytes(n_scenarios, paths, months, block_months, dtype, keep_paths) <= budget:
+            return block_months
+    needed = estimate_engine_bytes(n_scenarios, paths, months, 1, dtype, keep_paths)
+    raise SimulationMemoryError(
+        f"Simulation needs about {needed / 2 ** 20:.0f} MB, over the {SIMULATION_MEMORY_BUDGET_MB:g} MB budget. "
+        "Reduce paths or scenarios, or use precision='float32'."
+    )
+
+
+def _block_returns(
+    rows: np.ndarray,
+    block: np.ndarray,
+    window: slice,
+    override_mask: np.ndarray,
+    override_return: np.ndarray,
+) -> np.ndarray:
+    """指定情境在本區塊的月報酬 shape=(rows, 區塊月數, paths)；沒有 override 時為唯讀的廣播 view"""
+    mask = override_mask[rows, window]
+    if not mask.any():
+        return np.broadcast_to(block, (len(rows),) + block.shape)
+    # market_override 只覆蓋該情境那一列
+    return np.where(mask[:, :, None], override_return[rows, window][:, :, None], block)
+
+
+def _linear_recurrence(start: np.ndarray, invest: np.ndarray, growth: np.ndarray) -> np.ndarray:
+    """
+    解 P_t = (P_{t-1} + inv_t) * g_t（t 為區塊內的月份）：
+    P_t = G_t * (P_start + Σ_{k<=t} inv_k / G_{k-1})，G 為區塊內的累積成長率。
+    - start: shape=(rows, paths)；invest: shape=(rows, 區塊月數)；growth: shape=(區塊月數, paths)
+    回傳 shape=(rows, 區塊月數, paths)
+    """
+    n_months = growth.shape[0]
+    if not np.all(growth > 0.0):
+        # 報酬為 -100%（成長率為 0）時無法除以 G，退回逐月遞迴
+        values = np.empty((len(start),) + growth.shape, dtype=growth.dtype)
+        current = start
+        for month in range(n_months):
+            current = (current + invest[:, month:month + 1]) * growth[month]
+            values[:, month] = current
+        return values
+
+    cumulative = np.cumprod(growth, axis=0)                        # G_t
+    discount = np.empty_like(cumulative)                           # 1 / G_{t-1}
+    discount[0] = 1.0
+    np.divide(1.0, cumulative[:-1], out=discount[1:])
+    # Σ_{k<=t} inv_k / G_{k-1} 寫成下三角矩陣乘法，一次 matmul 算完整個區塊
+    weights = np.tril(np.ones((n_months, n_months), dtype=growth.dtype))[None, :, :] * invest[:, None, :]
+    # 以 PATH_BLOCK_SIZE 為單位做 matmul：BLAS 的捨入與矩陣寬度有關，
+    # 固定切法才能讓平行（分路徑區塊）與單一行程的結果完全相同
+    values = np.empty((len(start),) + growth.shape, dtype=growth.dtype)
+    for lo in range(0, growth.shape[1], PATH_BLOCK_SIZE):
+        values[:, :, lo:lo + PATH_BLOCK_SIZE] = weights @ discount[:, lo:lo + PATH_BLOCK_SIZE]
+    values += start[:, None, :]
+    values *= cumulative
+    return values
+
+
+def _advance_vectorized(
+    portfolio: np.ndarray,
+    rows: np.ndarray,
+    block: np.ndarray,
+    window: slice,
+    invest_amount: np.ndarray,
+    cash_path: np.ndarray,
+    override_mask: np.ndarray,
+    override_return: np.ndarray,
+) -> np.ndarray:
+    """
+    向量化引擎（不會觸發自動賣出的情境）：用 _linear_recurrence 直接算出整個月份區塊，
+    更新 portfolio[rows] 並回傳 shape=(rows, 區塊月數, paths) 的資產。
+    本區塊沒有 market_override 的情境共用同一組累積成長率。
+    """
+    mask = override_mask[rows, window]
+    shared = ~mask.any(axis=1)
+    invest = invest_amount[rows, window]
+    if shared.all():
+        values = _linear_recurrence(portfolio[rows], invest, 1.0 + block)
+    else:
+        values = np.empty((len(rows),) + block.shape, dtype=block.dtype)
+    if shared.any() and not shared.all():
+        values[shared] = _linear_recurrence(portfolio[rows[shared]], invest[shared], 1.0 + block)
+    for i in np.flatnonzero(~shared):
+        # market_override 只覆蓋該情境那一列
+        returns = np.where(mask[i][:, None], override_return[rows[i], window][:, None], block)
+        values[i] = _linear_recurrence(portfolio[rows[i:i + 1]], invest[i:i + 1], 1.0 + returns)[0]
+
+    portfolio[rows] = values[:, -1]
+    values += cash_path[rows, window][:, :, None]  ## 總資產是用現金+投資變現算的
+    return values
+
+
+def _advance_loop(
+    portfolio: np.ndarray,
+    cash: np.ndarray,
+    rows: np.ndarray,
+    block: np.ndarray,
+    window: slice,
+    invest_amount: np.ndarray,
+    save_amount: np.ndarray,
+    cash_out: np.ndarray,
+    override_mask: np.ndarray,
+    override_return: np.ndarray,
+    auto_liquidate: bool,
+) -> np.ndarray:
+    """
+    逐月迴圈引擎（會觸發自動賣出的情境）：更新 portfolio[rows] 與 cash（只含這些情境），
+    回傳 shape=(rows, 區塊月數, paths) 的資產。
+    """
+    returns = _block_returns(rows, block, window, override_mask, override_return)
+    invest = invest_amount[rows, window]
+    save = save_amount[rows, window]
+    outflow = cash_out[rows, window]
+    current = portfolio[rows]
+    assets = np.empty((len(rows),) + block.shape, dtype=block.dtype)
+
+    for month in range(len(block)):
+        # ---- 1) 更新投資與現金 ----
+        current = (current + invest[:, month:month + 1]) * (1.0 + returns[:, month]) # P_{t+1}
+        cash += save[:, month:month + 1]                                              # C_{t+1}
+        # ---- 2) 套用一次性支出 ----
+        cash -= outflow[:, month:month + 1]
+
+        # ---- 3) 現金不足時，自動賣出投資補現金（optional） ----
+        if auto_liquidate:
+            negative = cash < 0.0
+            if np.any(negative):
+                required = -cash[negative]
+                to_sell = np.minimum(current[negative], required)
+                current[negative] -= to_sell
+                cash[negative] += to_sell
+
+        assets[:, month] = cash + current ## 總資產是用現金+投資變現算的
+
+    portfolio[rows] = current
+    return assets
+
+
+def _run_batch_task(kwargs: Dict[str, Any]) -> BatchResult:
+    """
+    process pool 的工作單位（必須是 module-level 函式才能 pickle）。
+    cache_returns=False（種子是臨時抽的，之後不會再用到）時不經過 shared_monthly_returns 的快取，
+    以免這些用不到第二次的項目把有 seed 請求的月報酬擠出快取。
+    """
+    cache_returns = kwargs.pop("cache_returns", True)
+    if kwargs.get("path_blocks") is None and cache_returns:
+        kwargs["returns"] = shared_monthly_returns(
+            kwargs["market"], kwargs["months"], kwargs["paths"], kwargs["seed"]
+        )
+    return run_paths_batch(**kwargs)
+
+
+def _collect(futures: List[Any], progress: Optional[ProgressCallback]) -> List[BatchResult]:
+    # 依序取回各 worker 的結果；回呼丟出例外（例如取消）時，取消還沒開始的工作
+    parts = []
+    try:
+        for done, future in enumerate(futures, start=1):
+            parts.append(future.result())
+            if progress is not None:
+                progress(done, len(futures))
+    except BaseException:
+        for future in futures:
+            future.cancel()
+        raise
+    return parts
+
+
+def run_paths_parallel(
+    months: int,
+    plans: List[ScenarioPlan],
+    market: MarketModelCore,
+    paths: int,
+    seed: Optional[int] = None,
+    percentiles: Sequence[float] = LINE_PERCENTILES,
+    returns: Optional[np.ndarray] = None,
+    progress: Optional[ProgressCallback] = None,
+    block_months: int = RETURN_BLOCK_MONTHS,
+    dtype: Precision = "float64",
+    quantile_months: Optional[np.ndarray] = None,
+    cache_returns: bool = True,
+) -> BatchResult:
+    """
+    與 run_paths_batch(keep_paths=False) 結果相同，但有設定 SIMULATION_WORKERS 且工作量
+    （情境數 × 路徑數）達到 SIMULATION_PARALLEL_MIN_WORK 時，分給常駐的 process pool：
+    - 情境數 >= worker 數：依情境切分，每個 worker 跑幾個情境的全部路徑
+    - 否則：依路徑區塊切分，每個 worker 跑全部情境的幾個路徑區塊，回到主行程再算分位數
+    每個路徑區塊的亂數由 SeedSequence.spawn 決定、與 worker 數無關，因此結果完全相同（bit-identical）。
+    平行時 progress 以完成的工作數回報 progress(已完成工作, 工作總數)。
+    依路徑區塊切分需要在主行程合併完整走勢，超出記憶體預算時改依情境切分。
+    cache_returns：seed 是呼叫端臨時抽的（請求本身沒有 seed）時傳 False，worker 不快取它的月報酬。
+    """
+    pool = get_pool()
+    workers = pool_workers()
+    n_blocks = len(path_block_bounds(paths))
+    if (
+        pool is None
+        or is_deterministic(market)
+        or len(plans) * paths < PARALLEL_MIN_WORK
+        or (len(plans) < 2 and n_blocks < 2)
+    ):
+        return run_paths_batch(
+            months=months,
+            plans=plans,
+            market=market,
+            paths=paths,
+            seed=seed,
+            keep_paths=False,
+            percentiles=percentiles,
+            returns=returns,
+            progress=progress,
+            block_months=block_months,
+            dtype=dtype,
+            quantile_months=quantile_months,
+        )
+
+    if seed is None:
+        # 沒有 seed 時先抽一組 entropy，讓所有 worker 使用同一組子亂數流（不快取）
+        seed = np.random.SeedSequence().entropy
+        cache_returns = False
+    base = dict(
+        months=months, market=market, paths=paths, seed=seed, percentiles=percentiles,
+        block_months=block_months, dtype=dtype, quantile_months=quantile_months,
+        cache_returns=cache_returns,
+    )
+    budget = _memory_budget_bytes()
+    split_paths_fits = budget is None or budget >= estimate_engine_bytes(
+        len(plans), paths, months, block_months, dtype, keep_paths=True
+    )
+
+    if len(plans) >= workers or n_blocks < 2 or not split_paths_fits:
+        chunks = [chunk for chunk in np.array_split(np.arange(len(plans)), workers) if len(chunk)]
+        futures = [
+            pool.submit(
+                _run_batch_task, {**base, "plans": [plans[i] for i in chunk], "keep_paths": False}
+            )
+            for chunk in chunks
+        ]
+        parts = _collect(futures, progress)
+        return BatchResult(
+            percentiles=parts[0].percentiles,
+            series=np.concatenate([part.series for part in parts], axis=1),
+            final_sample=np.concatenate([part.final_sample for part in parts], axis=0),
+            paths=paths,
+        )
+
+    groups = [group for group in np.array_split(np.arange(n_blocks), workers) if len(group)]
+    futures = [
+        pool.submit(
+            _run_batch_task,
+            {
+                **base,
+                "plans": plans,
+                "keep_paths": True,
+                "path_blocks": (int(group[0]), int(group[-1]) + 1),
+                "quantile_series": False,
+            },
+        )
+        for group in groups
+    ]
+    parts = _collect(futures, progress)
+    # 各路徑區塊的完整走勢接回 (scenarios, paths, months)，一次算出所有月份的分位數
+    asset_paths = np.concatenate([part.asset_paths for part in parts], axis=1)
+    computed = parts[0].percentiles
+    return BatchResult(
+        percentiles=computed,
+        series=quantiles(
+            asset_paths if quantile_months is None else asset_paths[:, :, quantile_months], computed, axis=1
+        ),
+        final_sample=asset_paths[:, :, -1].copy(),
+        paths=paths,
+    )
+
+
+# 自適應路徑數：估計標準誤時把樣本切成幾批
+ADAPTIVE_BATCHES = 16
+
+
+def quantile_standard_error(
+    final_sample: np.ndarray,
+    percentiles: Sequence[float] = LINE_PERCENTILES,
+    batches: int = ADAPTIVE_BATCHES,
+) -> float:
+    """
+    以分批（batch means）估計期末資產分位數的標準誤：路徑彼此獨立，把樣本切成 batches 批，
+    各批分位數的標準差 / sqrt(batches) 即為全體分位數的標準誤（一次 partition，不必重抽樣）。
+    回傳所有情境、所有分位數中最大的「相對」誤差：標準誤 / max(|P50|, P95 - P05)
+    （以圖表的尺度衡量，中位數接近 0 時不會失真）。final_sample shape=(scenarios, paths)
+    """
+    n_rows, n = final_sample.shape
+    size = n // batches
+    point = quantiles(final_sample, LINE_PERCENTILES, axis=-1)             # (3, scenarios)
+    scale = np.maximum(np.abs(point[1]), point[2] - point[0])
+    per_batch = quantiles(
+        final_sample[:, :size * batches].reshape(n_rows, batches, size), percentiles, axis=-1
+    )                                                                      # (Q, scenarios, batches)
+    error = per_batch.std(axis=-1, ddof=1) / np.sqrt(batches)
+    # 所有路徑的期末資產都相同（例如固定報酬）時沒有抽樣誤差
+    relative = np.divide(error, scale, out=np.zeros_like(error), where=scale > 0.0)
+    return float(relative.max())
+
+
+def run_paths_adaptive(
+    months: int,
+    plans: List[ScenarioPlan],
+    market: MarketModelCore,
+    paths: int,
+    tolerance: float,
+    seed: Optional[int] = None,
+    percentiles: Sequence[float] = LINE_PERCENTILES,
+    progress: Optional[ProgressCallback] = None,
+    block_months: int = RETURN_BLOCK_MONTHS,
+    dtype: Precision = "float64",
+    quantile_months: Optional[np.ndarray] = None,
+) -> BatchResult:
+    """
+    自適應路徑數：以路徑區塊（PATH_BLOCK_SIZE 條）為單位逐批模擬，
+    每批之後估計期末 P05/P50/P95 的相對標準誤（quantile_standard_error），
+    低於 tolerance 就停止，最多到 paths 條。
+    每個路徑區塊的亂數與一次跑完時相同，因此停在 N 條的結果與 run_paths_batch(paths=N) 完全相同。
+    回傳的 BatchResult.paths 為實際模擬的路徑數，quantile_error 為最後估計的誤差。
+    progress 以已完成的路徑區塊數回報 progress(已完成區塊, 區塊總數)。
+    """
+    if is_deterministic(market):
+        result = run_paths_batch(
+            months=months, plans=plans, market=market, paths=paths, seed=seed,
+            keep_paths=False, percentiles=percentiles, progress=progress,
+            block_months=block_months, dtype=dtype, quantile_months=quantile_months,
+        )
+        result.quantile_error = 0.0
+        return result
+
+    if seed is None:
+        # 所有批次使用同一組 entropy
+        seed = np.random.SeedSequence().entropy
+    n_blocks = len(path_block_bounds(paths))
+
+    # 各批次的完整走勢 shape=(scenarios, 區塊路徑數, months)，停止時再一次算出所有月份的分位數
+    parts: List[np.ndarray] = []
+    error = np.inf
+    for block in range(n_blocks):
+        part = run_paths_batch(
+            months=months,
+            plans=plans,
+            market=market,
+            paths=paths,
+            seed=seed,
+            keep_paths=True,
+            percentiles=percentiles,
+            path_blocks=(block, block + 1),
+            quantile_series=False,
+            block_months=block_months,
+            dtype=dtype,
+        )
+        parts.append(part.asset_paths)
+        computed = part.percentiles
+        if progress is not None:
+            progress(block + 1, n_blocks)
+        final_sample = np.concatenate([asset_paths[:, :, -1] for asset_paths in parts], axis=1)
+        error = quantile_standard_error(final_sample)
+        if error <= tolerance:
+            break
+
+    # 排成 (scenarios, months, paths)，讓分位數沿著連續的最後一軸計算
+    asset_paths = np.concatenate([np.moveaxis(part, 1, 2) for part in parts], axis=-1)
+    if quantile_months is not None:
+        asset_paths = asset_paths[:, quantile_months]
+    return BatchResult(
+        percentiles=computed,
+        series=quantiles(asset_paths, computed, axis=-1),
+        final_sample=final_sample,
+        paths=final_sample.shape[1],
+        quantile_error=error,
+    )
+
+
 def run_paths(
     months: int,
     income_monthly: float,
@@ -179,182 +1170,96 @@ def run_paths(
     auto_liquidate: bool = True,
 ) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
     """
-    核心蒙地卡羅模擬：
+    核心蒙地卡羅模擬（單一情境，為 run_paths_batch 的一列）：
     回傳 (asset_paths, med, p05, p95)
     - asset_paths: shape=(paths, months) 的資產走勢，用於後續箱形圖等計算（每條路徑每個月的資產值）
     - med, p05, p95: 供折線 + 區間帶使用
     """
-    rng = np.random.default_rng(seed)
-    ## 生成月報酬率矩陣（若mode為nomal則月報酬率符合常態分佈）
-    monthly_returns = gen_monthly_returns(market, months, paths, rng)
+    plan = ScenarioPlan(
+        name="",
+        income_monthly=income_monthly,
+        expenses_monthly=expenses_monthly,
+        invest_ratio=invest_ratio,
+        schedule=compile_events(events, months),
+        initial_assets=initial_assets,
+    )
+    result = run_paths_batch(
+        months=months,
+        plans=[plan],
+        market=market,
+        paths=paths,
+        seed=seed,
+        auto_liquidate=auto_liquidate,
+    )
+    return result.asset_paths[0], result.med[0], result.p05[0], result.p95[0]
 
-    # 狀態變數
-    # 初始資產按投資比例分配
-    initial_invest_ratio = np.clip(invest_ratio, 0.0, 1.0)
-    initial_cash = initial_assets * (1.0 - initial_invest_ratio)
-    initial_portfolio = initial_assets * initial_invest_ratio
-    
-    cash = np.full(paths, initial_cash)          # C_t (初始現金)
-    portfolio = np.full(paths, initial_portfolio) # P_t (初始投資組合)
-    alpha = np.full(paths, initial_invest_ratio)  # 投資比 α_t
-    income = np.full(paths, income_monthly)      # I_t
-    base_expense = month_budget_total(expenses_monthly)     # 固定月支出
-    
-    # 事件依月份分組
-    events_by_month: Dict[int, List[EventCore]] = {}
-    for event in events:
-        events_by_month.setdefault(event.month_idx, []).append(event)
-
-    med = np.zeros(months)
-    p05 = np.zeros(months)
-    p95 = np.zeros(months)
-    asset_paths = np.zeros((paths, months))
-
-    for idx in range(months):
-        # ---- 1) 可投資金額（收入 - 支出）----
-        discretionary = np.maximum(income - base_expense, 0.0) # D_t(月收－月支出)
-        invest_amount = alpha * discretionary                   # 投資金額
-        save_amount = (1.0 - alpha) * discretionary            # 留現金
-
-        # ---- 2) 更新投資與現金 ----
-        portfolio = (portfolio + invest_amount) * (1.0 + monthly_returns[:, idx]) # P_{t+1}
-        cash = cash + save_amount                                                 # C_{t+1} (先不扣一次性支出)
-
-        # ---- 3) 套用事件 ----
-        if idx in events_by_month:
-            for event in events_by_month[idx]:
-                ## 一次性消費
-                if event.type == "expense" and event.amount is not None:
-                    cash -= float(event.amount) ## 現金流（儲蓄減少）
-                ## 收入比例or金額提升多少
-                elif event.type == "income_delta" and event.delta is not None:
-                    delta = float(event.delta)
-                    # |delta|<1 → 視為百分比；否則視為金額
-                    if abs(delta) < 1.0:
-                        income *= (1.0 + delta)
-                    else:
-                        income += delta
-                ## 投資比例增加多少
-                elif event.type == "invest_ratio_delta" and event.delta is not None:
-                    alpha = np.clip(alpha + float(event.delta), 0.0, 1.0)
-                elif event.type == "market_override" and event.amount is not None:
-                    # e.amount 視為「這個月的年化報酬」
-                    ann = float(event.amount)
-                    if abs(ann) > 1.0:
-                        ann /= 100.0
-                    monthly_returns[:, idx] = annual_to_monthly_r(ann)
-
-
-        # ---- 4) 現金不足時，自動賣出投資補現金（optional） ----
-        if auto_liquidate:
-            negative = cash < 0.0
-            if np.any(negative):
-                required = -cash[negative]
-                to_sell = np.minimum(portfolio[negative], required)
-                portfolio[negative] -= to_sell
-                cash[negative] += to_sell
 
-        asset = cash + portfolio ## 總資產是用現金+投資變現算的
-        asset_paths[:, idx] = asset
-        med[idx] = np.median(asset)
-        p05[idx] = np.percentile(asset, 5)
-        p95[idx] = np.percentile(asset, 95)
+def line_chart_months(options: LineChartOptions, months: int) -> Optional[np.ndarray]:
+    """
+    lineChart 事先就能決定的輸出月份（0 起算）：every_nth / yearly 以最後一個月為終點往回每 step 個月取一點。
+    monthly 與 lttb（要看模擬結果才能挑點）回傳 None，表示引擎要算全部月份。
+    """
+    step = 12 if options.mode == "yearly" else options.step
+    if options.mode not in ("every_nth", "yearly") or step <= 1:
+        return None
+    return np.arange(months - 1, -1, -step)[::-1]
 
-    return asset_paths, med, p05, p95
 
+def lttb_indices(values: np.ndarray, points: int) -> np.ndarray:
+    """
+    LTTB（largest-triangle-three-buckets）降採樣：保留第一與最後一點，
+    中間分成 points - 2 個桶，每桶挑出與「前一個選中點、下一桶平均點」圍成三角形面積最大的點。
+    回傳選中的索引（遞增）。
+    """
+    n = len(values)
+    if points >= n:
+        return np.arange(n)
+    x = np.arange(n, dtype=float)
+    edges = np.linspace(1, n - 1, points - 1).astype(int)  # 中間各桶的邊界 [edges[i], edges[i+1])
+    selected = [0]
+    for i in range(points - 2):
+        lo, hi = edges[i], edges[i + 1]
+        if i + 1 < points - 2:
+            next_x, next_y = x[hi:edges[i + 2]].mean(), values[hi:edges[i + 2]].mean()
+        else:
+            next_x, next_y = x[-1], values[-1]
+        prev = selected[-1]
+        area = np.abs(
+            (x[prev] - next_x) * (values[lo:hi] - values[prev])
+            - (x[prev] - x[lo:hi]) * (next_y - values[prev])
+        )
+        selected.append(lo + int(np.argmax(area)))
+    selected.append(n - 1)
+    return np.asarray(selected)
 
-def _build_events(events: Optional[List[Event]], months: int) -> List[EventCore]:
-    core_events: List[EventCore] = []
-    if not events:
-        # 先簡單 skip
-        return core_events
 
-    for event in events:
-        start = event.month_idx
-        end = event.end_month_idx if event.end_month_idx is not None else start
-        if end < start:
-            end = start
+@dataclass
+class ScenarioResult:
+    """單一情境的模擬結果（逐月 P05/P50/P95、額外分位數帶、期末資產箱形統計）"""
+    median: np.ndarray
+    p05: np.ndarray
+    p95: np.ndarray
+    bands: Dict[str, np.ndarray]
+    final_stats: Dict[str, float]
+    paths: int = 0                          # 實際模擬的路徑數
+    quantile_error: Optional[float] = None  # 只有自適應模式才有
 
-        # 期間事件：依事件類型分成三種情況
-        # 1) 一次性現金流 / 區間每月都扣 or override：expense & market_override
-        if event.type in ("expense", "market_override"):
-            for month in range(start, end + 1):
-                core_events.append(
-                    EventCore(
-                        month_idx=month,
-                        type=event.type,
-                        label=event.label,
-                        amount=event.amount,
-                        delta=event.delta,
-                    )
-                )
-        # 2) 永久型變動（沒有 end_month_idx）：income_delta / invest_ratio_delta
-        elif event.end_month_idx is None:
-            core_events.append(
-                EventCore(
-                    month_idx=start,
-                    type=event.type,
-                    label=event.label,
-                    amount=event.amount,
-                    delta=event.delta,
-                )
-            )
-        # 3) 區間型暫時變動（有 end_month_idx）：income_delta / invest_ratio_delta 期間提升 / 降低，之後恢復
-        else:
-            delta = event.delta or 0.0
-            # 區間開始：套用原來的 delta
-            core_events.append(
-                EventCore(
-                    month_idx=start,
-                    type=event.type,
-                    label=event.label,
-                    amount=event.amount,
-                    delta=delta,
-                )
-            )
-            # 區間結束的下一個月：套用「反向 delta」恢復原值
-            revert_month = end + 1
-            # 不要超過模擬範圍
-            if revert_month < months:
-                if event.type == "income_delta":
-                    # 百分比 vs 金額兩種模式
-                    if abs(delta) < 1.0:
-                        # percentage: income *= (1+d) ... then * (1/(1+d)) 回復
-                        revert_delta = (1.0 / (1.0 + delta)) - 1.0
-                    else:
-                        # additive: income += d ... then += -d 回復
-                        revert_delta = -delta
-                elif event.type == "invest_ratio_delta":
-                    # 投資比例是單純加法，反向就是 -d
-                    revert_delta = -delta
-                else:
-                    revert_delta = 0.0 # 理論上不會進來
-
-                core_events.append(
-                    EventCore(
-                        month_idx=revert_month,
-                        type=event.type,
-                        label=f"{event.label or ''} (revert)".strip(),
-                        amount=event.amount,
-                        delta=revert_delta,
-                    )
-                )
+    @property
+    def nbytes(self) -> int:
+        arrays = [self.median, self.p05, self.p95, *self.bands.values()]
+        return sum(array.nbytes for array in arrays) + 64 * (len(self.final_stats) + len(self.bands))
 
-    return core_events
 
+# 情境結果快取：只改一張情境卡時，Baseline 與其他沒變的情境直接沿用
+SCENARIO_CACHE_MAX_BYTES = int(os.getenv("SCENARIO_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
 
-def simulate_financial_plan(request: SimulationRequest) -> Dict[str, Any]:
-    """
-    執行財務規劃模擬，固定為10年（120個月）
-    """
-    # 使用固定的模擬期間
-    months = SIMULATION_MONTHS
-    
-    # 1. 執行核心模擬
-    base_expenses = expenses_to_dict(request.expenses)
-    scenarios: List[Scenario] = [Scenario(name="Baseline")] + request.scenarios
+_scenario_cache = LRUCache(
+    SCENARIO_CACHE_MAX_BYTES, SIMULATION_CACHE_TTL_SECONDS, sizeof=lambda result: result.nbytes
+)
 
-    market_core = MarketModelCore(
+
+def _market_core(request: SimulationRequest) -> MarketModelCore:
+    return MarketModelCore(
         mode=request.market_model.mode,
         profile=request.market_model.profile,
         fixed_annual_return=_as_rate(request.market_model.fixed_annual_return),
@@ -362,98 +1267,272 @@ def simulate_financial_plan(request: SimulationRequest) -> Dict[str, Any]:
         normal_sigma=request.market_model.normal_sigma,
         annual_min=request.market_model.annual_min,
         annual_max=request.market_model.annual_max,
+        sampling=request.market_model.sampling,
     )
 
-    results: List[Dict[str, Any]] = []
-    final_assets_all: List[Tuple[str, np.ndarray]] = [] # 收集每個情境的期末資產樣本
-
-    for scenario in scenarios:
-        # 套用支出 / 投資比調整
-        expenses_adjusted = apply_expenses_delta(base_expenses, scenario.expenses_delta)
-        invest_ratio = float(
-            np.clip(
-                request.invest_ratio + (scenario.invest_ratio_delta or 0.0),
-                0.0,
-                1.0,
-            )
+
+def _build_plan(
+    request: SimulationRequest, base_expenses: Dict[str, float], scenario: Scenario, months: int
+) -> ScenarioPlan:
+    # 套用支出 / 投資比調整
+    expenses_adjusted = apply_expenses_delta(base_expenses, scenario.expenses_delta)
+    invest_ratio = float(
+        np.clip(
+            request.invest_ratio + (scenario.invest_ratio_delta or 0.0),
+            0.0,
+            1.0,
         )
+    )
+    return ScenarioPlan(
+        name=scenario.name,
+        income_monthly=request.income_monthly,
+        expenses_monthly=expenses_adjusted,
+        invest_ratio=invest_ratio,
+        schedule=compile_events(scenario.events, months), # 編譯 events
+        initial_assets=request.initial_assets,
+    )
+
+
+@dataclass(frozen=True)
+class CompiledBaseline:
+    """
+    不含情境卡的輸入（例如使用者儲存的財務設定）預先算好的部分，可跨請求重用：
+    各類別的支出、市場模型，以及預先生成的共用月報酬（固定報酬或矩陣太大時為 None）。
+    """
+    request: SimulationRequest          # scenarios 為空
+    base_expenses: Dict[str, float]
+    market_core: MarketModelCore
+    returns: Optional[np.ndarray]
+
+    @property
+    def nbytes(self) -> int:
+        return (self.returns.nbytes if self.returns is not None else 0) + 64 * (len(self.base_expenses) + 8)
+
+    def with_scenarios(self, scenarios: List[Scenario]) -> SimulationRequest:
+        # 兩部分都已經驗證過，不必重新驗證整個請求
+        return self.request.model_copy(update={"scenarios": list(scenarios)})
+
+
+def compile_baseline(request: SimulationRequest) -> CompiledBaseline:
+    base_expenses = expenses_to_dict(request.expenses)
+    market_core = _market_core(request)
+    return CompiledBaseline(
+        request=request.model_copy(update={"scenarios": []}),
+        base_expenses=base_expenses,
+        market_core=market_core,
+        returns=shared_monthly_returns(market_core, SIMULATION_MONTHS, request.paths, request.seed),
+    )
+
+
+def check_memory_budget(request: SimulationRequest) -> None:
+    """在排進模擬佇列之前檢查請求能否放進記憶體預算，不能就丟出 SimulationMemoryError"""
+    plan_block_months(
+        len(request.scenarios) + 1,
+        request.paths,
+        SIMULATION_MONTHS,
+        request.precision,
+        request.quantile_tolerance is not None,
+    )
+
 
-        # 轉換 events
-        events_core = _build_events(scenario.events, months)
+def _scenario_cache_key(request: SimulationRequest, scenario: Scenario) -> str:
+    # 情境內容（不含名稱）+ 它依賴的 baseline 輸入
+    return canonical_hash(
+        {
+            "scenario": scenario.model_dump(mode="json", exclude={"name"}),
+            "baseline": request.model_dump(mode="json", exclude={"scenarios"}),
+        }
+    )
 
-        # 跑 Monte Carlo
-        asset_paths, median, p05, p95 = run_paths(
+
+@dataclass
+class _PendingRows:
+    """
+    一次 run_paths 要模擬的情境列（可以來自多個請求，見 simulate_batch）：
+    run 提供整批共用的參數（paths / seed / precision / extra_percentiles / line_chart），
+    每一列各自的收入、支出、投資比例與事件都在 plans 裡。
+    """
+    run: SimulationRequest
+    keys: List[Optional[str]]
+    results: List[Optional[ScenarioResult]]
+    missing: List[int]
+    plans: List[ScenarioPlan]
+
+
+def _prepare_rows(
+    run: SimulationRequest, rows: List[Tuple[SimulationRequest, Scenario]], months: int
+) -> _PendingRows:
+    # 有 seed 時各情境的結果彼此獨立，可以逐列查快取；只有沒命中的列需要模擬。
+    # 自適應路徑數例外：停止點取決於整批中誤差最大的情境，單一情境的結果與同批的其他情境有關，不逐列快取
+    keys: List[Optional[str]] = [None] * len(rows)
+    results: List[Optional[ScenarioResult]] = [None] * len(rows)
+    if run.seed is not None and run.quantile_tolerance is None:
+        for i, (request, scenario) in enumerate(rows):
+            keys[i] = _scenario_cache_key(request, scenario)
+            results[i] = _scenario_cache.get(keys[i])
+    missing = [i for i, result in enumerate(results) if result is None]
+    plans = [
+        _build_plan(rows[i][0], expenses_to_dict(rows[i][0].expenses), rows[i][1], months)
+        for i in missing
+    ]
+    return _PendingRows(run=run, keys=keys, results=results, missing=missing, plans=plans)
+
+
+def _finish_rows(pending: _PendingRows, batch: Optional[BatchResult]) -> List[ScenarioResult]:
+    # 把批次結果拆回各列（順序與 rows 相同），並寫進情境快取
+    request = pending.run
+    if pending.missing and batch is not None:
+        # 期末資產樣本的箱形統計：所有情境一次算完，shape=(len(BOX_PERCENTILES), scenarios)
+        final_stats = batch.final_quantiles(BOX_PERCENTILES)
+
+        for row, i in enumerate(pending.missing):
+            result = ScenarioResult(
+                median=batch.med[row].copy(),
+                p05=batch.p05[row].copy(),
+                p95=batch.p95[row].copy(),
+                bands={
+                    percentile_key(q): batch.band(q)[row].copy()
+                    for q in request.extra_percentiles
+                },
+                final_stats={
+                    percentile_key(q): float(v) for q, v in zip(BOX_PERCENTILES, final_stats[:, row])
+                },
+                paths=batch.paths,
+                quantile_error=batch.quantile_error,
+            )
+            if pending.keys[i] is not None:
+                _scenario_cache.set(pending.keys[i], result)
+            pending.results[i] = result
+
+    return [result for result in pending.results if result is not None]
+
+
+def simulate_scenarios(
+    request: SimulationRequest,
+    scenarios: List[Scenario],
+    market_core: MarketModelCore,
+    months: int = SIMULATION_MONTHS,
+    progress: Optional[ProgressCallback] = None,
+    stream_seed: Optional[int] = None,
+    returns: Optional[np.ndarray] = None,
+) -> List[ScenarioResult]:
+    """
+    模擬多個情境並回傳各自的結果（順序與 scenarios 相同）。
+    有 seed 時所有情境共用同一組月報酬，各情境的結果彼此獨立，
+    因此可以逐情境快取：只有快取沒命中的情境才一起丟進 run_paths_batch。
+    stream_seed：請求沒有 seed 時使用的亂數種子（不快取），
+    讓分次呼叫的情境仍然共用同一組月報酬（見 iter_simulation_events）。
+    returns：預先生成的共用月報酬（見 CompiledBaseline），None 時由 shared_monthly_returns 取得。
+    """
+    pending = _prepare_rows(request, [(request, scenario) for scenario in scenarios], months)
+    if not pending.missing:
+        return _finish_rows(pending, None)
+
+    plans = pending.plans
+    seed = request.seed if request.seed is not None else stream_seed
+    # every_nth / yearly 只在輸出的月份計算分位數
+    quantile_months = line_chart_months(request.line_chart, months)
+    adaptive = request.quantile_tolerance is not None
+    # 在記憶體預算內挑月份區塊大小（放不下就丟出 SimulationMemoryError）
+    block_months = plan_block_months(len(plans), request.paths, months, request.precision, adaptive)
+    if adaptive:
+        # 自適應路徑數：分批模擬到期末分位數夠穩定為止，paths 為上限
+        batch = run_paths_adaptive(
+            months=months,
+            plans=plans,
+            market=market_core,
+            paths=request.paths,
+            tolerance=request.quantile_tolerance,
+            seed=seed,
+            percentiles=request.extra_percentiles,
+            progress=progress,
+            block_months=block_months,
+            dtype=request.precision,
+            quantile_months=quantile_months,
+        )
+    else:
+        # 跑 Monte Carlo（沒命中的情境一次批次模擬；只需要分位數與期末樣本，使用串流模式；
+        # 工作量大時分給 process pool）
+        # 同一組 (market, paths, seed) 的月報酬只生成一次，跨情境、跨請求共用
+        batch = run_paths_parallel(
             months=months,
-            income_monthly=request.income_monthly,
-            expenses_monthly=expenses_adjusted,
-            invest_ratio=invest_ratio,
+            plans=plans,
             market=market_core,
-            events=events_core,
             paths=request.paths,
-            initial_assets=request.initial_assets,
-            seed=request.seed,
+            seed=seed,
+            percentiles=request.extra_percentiles,
+            returns=(
+                returns
+                if returns is not None
+                else shared_monthly_returns(market_core, months, request.paths, request.seed)
+            ),
+            progress=progress,
+            block_months=block_months,
+            dtype=request.precision,
+            quantile_months=quantile_months,
+            cache_returns=request.seed is not None,
         )
+    return _finish_rows(pending, batch)
 
-        # 蒐集期末資產樣本
-        final_assets = asset_paths[:, -1]
-        final_assets_all.append((scenario.name, final_assets))
+def _scenario_entry(
+    request: SimulationRequest,
+    base_expenses: Dict[str, float],
+    scenario: Scenario,
+    scenario_result: ScenarioResult,
+    months: int,
+) -> Dict[str, Any]:
+    stats = scenario_result.final_stats
+    expense_total = month_budget_total(
+        apply_expenses_delta(base_expenses, scenario.expenses_delta)
+    )
+    # 逐月序列維持 numpy 陣列，序列化時才轉換（見 SimulationEncoding.encode_result）
+    return {
+        "scenario": scenario.name,
+        "median": scenario_result.median,
+        "p05": scenario_result.p05,
+        "p95": scenario_result.p95,
+        "bands": dict(scenario_result.bands),
+        "monthly_expense_total": expense_total,
+        "monthly_saving_rate": monthly_saving_rate(
+            request.income_monthly, expense_total
+        ),
+        # 為了 StatCards 收集 Baseline P05/P75
+        "final_p05": stats["p05"],
+        "final_p75": stats["p75"],
+        "final_stats": stats,
+    }
 
-        results.append(
-            {
-                "scenario": scenario.name,
-                "months": list(range(1, months + 1)),
-                "median": median.tolist(),
-                "p05": p05.tolist(),
-                "p95": p95.tolist(),
-                "monthly_expense_total": float(sum(expenses_adjusted.values())),
-                "monthly_saving_rate": monthly_saving_rate(
-                    request.income_monthly, sum(expenses_adjusted.values())
-                ),
-                # 為了 StatCards 收集 Baseline P05/P75
-                "final_p05": float(np.percentile(final_assets, 5)),
-                "final_p75": float(np.percentile(final_assets, 75)),
-            }
-        )
 
-    # 組期末資產箱形圖 / summary
-    summaries: List[Dict[str, Any]] = []
-    # 使用初始資產作為 CAGR 計算的起點
-    first_asset = request.initial_assets
+def _select_months(result: Dict[str, Any], indices: np.ndarray) -> None:
+    # LTTB 挑出的月份：所有情境共用同一組 categories
+    for key in ("median", "p05", "p95"):
+        result[key] = result[key][indices]
+    result["bands"] = {key: band[indices] for key, band in result["bands"].items()}
 
-    for name, values in final_assets_all:
-        values_np = np.asarray(values, dtype=float)
-        stats = box_stats(values_np)
-        last_med = float(np.median(values_np))
-        cagr = realized_cagr(first_asset, last_med, months)
-        summaries.append(
-            {
-                "scenario": name,
-                "final_asset_median": float(stats["p50"]),
-                "annualized_return_realized": cagr,
-            }
-        )
-        
-    # 2. 轉換為前端所需格式
 
-    # 2.1. 轉換 lineChart 數據（每個情境都有完整的 P05/P50/P95）
-    categories = results[0]["months"] if results else []
-    
-    # 構建 scenarios 列表，每個情境包含 median, p05, p95
-    scenarios_data = []
-    for result in results:
-        scenarios_data.append({
-            "name": result["scenario"],
-            "median": result["median"],
-            "confidenceUpper": result["p95"],
-            "confidenceLower": result["p05"],
-        })
+def _line_chart_categories(request: SimulationRequest, months: int) -> Optional[List[int]]:
+    # 事先就能決定的 categories（1 起算）；lttb 要等 Baseline 模擬完才知道，回傳 None
+    if request.line_chart.mode == "lttb":
+        return None
+    selected = line_chart_months(request.line_chart, months)
+    return list(range(1, months + 1)) if selected is None else (selected + 1).tolist()
 
-    line_chart_data = {
-        "categories": categories,
-        "scenarios": scenarios_data,
+
+def _line_chart_scenario(result: Dict[str, Any]) -> Dict[str, Any]:
+    # 每個情境包含 median, p05, p95
+    scenario_data = {
+        "name": result["scenario"],
+        "median": result["median"],
+        "confidenceUpper": result["p95"],
+        "confidenceLower": result["p05"],
     }
+    # 額外要求的分位數帶（例如 p10/p90、p25/p75）
+    if result["bands"]:
+        scenario_data["bands"] = result["bands"]
+    return scenario_data
+
 
-    # 2.2. 轉換 pieChart 數據
+def _pie_chart(base_expenses: Dict[str, float]) -> Dict[str, Any]:
     pie_expenses_list = []
     for i, (category, amount) in enumerate(base_expenses.items()):
         pie_expenses_list.append({
@@ -461,12 +1540,35 @@ def simulate_financial_plan(request: SimulationRequest) -> Dict[str, Any]:
             "amount": round(amount, 2), # 使用絕對月支出金額
             "color": COLOR_PALETTE[i % len(COLOR_PALETTE)] # 循環使用顏色
         })
-        
-    pie_chart_data = {"expenses": pie_expenses_list}
-    
-    # 2.3. 轉換 statCards 數據 (以 Baseline 情境為主)
+    return {"expenses": pie_expenses_list}
+
+
+def _stat_cards(
+    request: SimulationRequest,
+    base_expenses: Dict[str, float],
+    market_core: MarketModelCore,
+    results: List[Dict[str, Any]],
+    months: int,
+) -> List[Dict[str, Any]]:
+    """statCards 數據 (以 Baseline 情境為主)"""
+    # 組期末資產箱形圖 / summary
+    summaries: List[Dict[str, Any]] = []
+    # 使用初始資產作為 CAGR 計算的起點
+    first_asset = request.initial_assets
+
+    for result in results:
+        stats = result["final_stats"]
+        cagr = realized_cagr(first_asset, stats["p50"], months)
+        summaries.append(
+            {
+                "scenario": result["scenario"],
+                "final_asset_median": stats["p50"],
+                "annualized_return_realized": cagr,
+            }
+        )
+
     stat_cards = []
-    
+
     if summaries:
         baseline_summary = summaries[0]
         baseline_result = results[0]
@@ -524,9 +1626,443 @@ def simulate_financial_plan(request: SimulationRequest) -> Dict[str, Any]:
             "trend": _determine_trend(diff_p05_p50 / final_asset_median if final_asset_median else 0)
         })
 
+    return stat_cards
+
+
+def simulate_financial_plan(
+    request: SimulationRequest, progress: Optional[ProgressCallback] = None
+) -> Dict[str, Any]:
+    """
+    執行財務規劃模擬，固定為10年（120個月）
+    progress：模擬進度回呼（見 run_paths_batch），供非同步工作回報完成百分比
+    """
+    return to_jsonable(_simulation_output(request, progress))
+
+
+def _simulation_output(
+    request: SimulationRequest,
+    progress: Optional[ProgressCallback] = None,
+    baseline: Optional[CompiledBaseline] = None,
+) -> Dict[str, Any]:
+    """
+    同 simulate_financial_plan，但 lineChart 的序列維持 numpy 陣列（序列化時不必經過 .tolist()）。
+    baseline：request 由它的 with_scenarios() 產生時，直接沿用其中預先算好的支出、市場模型與月報酬。
+    """
+    # 使用固定的模擬期間
+    months = SIMULATION_MONTHS
+    
+    # 1. 執行核心模擬
+    scenarios: List[Scenario] = [Scenario(name="Baseline")] + request.scenarios
+    if baseline is not None:
+        base_expenses, market_core, returns = baseline.base_expenses, baseline.market_core, baseline.returns
+    else:
+        base_expenses, market_core, returns = expenses_to_dict(request.expenses), _market_core(request), None
+
+    scenario_results = simulate_scenarios(request, scenarios, market_core, months, progress, returns=returns)
+    return _assemble_output(request, scenarios, scenario_results, base_expenses, market_core, months)
+
+
+def _assemble_output(
+    request: SimulationRequest,
+    scenarios: List[Scenario],
+    scenario_results: List[ScenarioResult],
+    base_expenses: Dict[str, float],
+    market_core: MarketModelCore,
+    months: int,
+) -> Dict[str, Any]:
+    results = [
+        _scenario_entry(request, base_expenses, scenario, scenario_result, months)
+        for scenario, scenario_result in zip(scenarios, scenario_results)
+    ]
+
+    # 2. 轉換為前端所需格式
+
+    # 2.1. 轉換 lineChart 數據（每個情境都有完整的 P05/P50/P95）
+    categories = _line_chart_categories(request, months)
+    if categories is None and results:
+        # LTTB：以 Baseline 的中位數挑點，所有情境共用
+        indices = lttb_indices(results[0]["median"], request.line_chart.points)
+        for result in results:
+            _select_months(result, indices)
+        categories = (indices + 1).tolist()
+    line_chart_data = {
+        "categories": categories if results else [],
+        "scenarios": [_line_chart_scenario(result) for result in results],
+    }
+
     # 3. 組裝最終輸出
-    return {
+    output = {
         "lineChart": line_chart_data,
-        "pieChart": pie_chart_data,
-        "statCards": stat_cards,
+        "pieChart": _pie_chart(base_expenses),
+        "statCards": _stat_cards(request, base_expenses, market_core, results, months),
+    }
+    if request.quantile_tolerance is not None:
+        output["simulation"] = _adaptive_summary(scenario_results)
+    return output
+
+
+def _adaptive_summary(scenario_results: List[ScenarioResult]) -> Dict[str, Any]:
+    # 自適應模式實際用到的路徑數與估計誤差（情境分批快取時取最大值）
+    return {
+        "paths": max(result.paths for result in scenario_results),
+        "quantileError": max(result.quantile_error or 0.0 for result in scenario_results),
+    }
+
+
+def iter_simulation_events(request: SimulationRequest) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """
+    串流版的 simulate_financial_plan：依序產生 (event, data)
+    - "lineChart"：categories（月份），不需要模擬，立即送出（lttb 在 Baseline 模擬完後送出）
+    - "pieChart"：支出圓餅，不需要模擬
+    - "scenario"：每個情境模擬完成就送出它的 lineChart 序列（Baseline 最先）
+    - "statCards"：最後送出
+    每個情境分別模擬；沒有 seed 的請求會先抽一個種子給所有情境共用，
+    因此情境之間比較的仍是同一組市場報酬，結果與非串流版相同（有 seed 時完全一致）。
+    例外是自適應模式（quantile_tolerance）：每個情境各自決定停止的路徑數，
+    非串流版則由整批誤差最大的情境決定，兩者的路徑數與結果可能不同（各自仍符合誤差容忍度）。
+    """
+    months = SIMULATION_MONTHS
+    base_expenses = expenses_to_dict(request.expenses)
+    scenarios: List[Scenario] = [Scenario(name="Baseline")] + request.scenarios
+    market_core = _market_core(request)
+    stream_seed = None
+    if request.seed is None:
+        stream_seed = int(np.random.SeedSequence().generate_state(1)[0])
+
+    categories = _line_chart_categories(request, months)
+    if categories is not None:
+        yield "lineChart", {"categories": categories}
+    yield "pieChart", _pie_chart(base_expenses)
+    indices: Optional[np.ndarray] = None
+
+    results: List[Dict[str, Any]] = []
+    scenario_results: List[ScenarioResult] = []
+    for index, scenario in enumerate(scenarios):
+        (scenario_result,) = simulate_scenarios(
+            request, [scenario], market_core, months, stream_seed=stream_seed
+        )
+        result = _scenario_entry(request, base_expenses, scenario, scenario_result, months)
+        if categories is None:
+            if indices is None:
+                # LTTB：Baseline 模擬完才能挑點，categories 緊接著送出
+                indices = lttb_indices(result["median"], request.line_chart.points)
+                yield "lineChart", {"categories": (indices + 1).tolist()}
+            _select_months(result, indices)
+        results.append(result)
+        scenario_results.append(scenario_result)
+        yield "scenario", {"index": index, **to_jsonable(_line_chart_scenario(result))}
+
+    summary: Dict[str, Any] = {"statCards": _stat_cards(request, base_expenses, market_core, results, months)}
+    if request.quantile_tolerance is not None:
+        summary["simulation"] = _adaptive_summary(scenario_results)
+    yield "statCards", summary
+
+
+def _batch_group_key(request: SimulationRequest) -> Hashable:
+    # 同一組的請求共用一組月報酬、一起跑 run_paths：市場模型、路徑數、seed 與輸出參數都要相同
+    return (
+        _market_core(request),
+        request.paths,
+        request.seed,
+        request.precision,
+        tuple(request.extra_percentiles),
+        request.line_chart.mode,
+        request.line_chart.step,
+        request.line_chart.points,
+    )
+
+
+def _batch_chunk_rows(n_rows: int, paths: int, dtype: Precision, workers: int) -> int:
+    """
+    一次 run_paths 放幾列：
+    - 不超過記憶體預算（月份區塊維持 RETURN_BLOCK_MONTHS）
+    - 有 process pool 時切成約 workers 份，但每份至少 PARALLEL_MIN_WORK（列數 × 路徑數）
+    """
+    rows = n_rows
+    if workers > 1:
+        rows = min(rows, max(-(-n_rows // workers), -(-PARALLEL_MIN_WORK // paths)))
+    budget = _memory_budget_bytes()
+    if budget is not None:
+        per_row = estimate_engine_bytes(1, paths, SIMULATION_MONTHS, RETURN_BLOCK_MONTHS, dtype) - 32 * RETURN_BLOCK_MONTHS * paths
+        rows = min(rows, max((budget - 32 * RETURN_BLOCK_MONTHS * paths) // per_row, 1))
+    return max(int(rows), 1)
+
+
+def simulate_batch(requests: List[SimulationRequest]) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    """
+    批次模擬多個請求，依序產生 (請求索引, 輸出)；輸出與個別呼叫 simulate_financial_plan 相同
+    （lineChart 的序列為 numpy 陣列）。
+    - 依 (市場模型, paths, seed, precision, 分位數, line_chart) 分組，同一組所有請求的所有情境
+      成為同一次 run_paths 的情境列，共用一組月報酬（沒有 seed 的組抽一個種子共用）
+    - 組太大時依記憶體預算與 worker 數切塊；有 process pool 時所有塊一起送出，
+      不同組也同時在不同核心上執行
+    - 請求的所有情境都完成就產生該請求的輸出，因此順序依分組而定，不一定是索引順序
+    自適應路徑數（quantile_tolerance）的請求各自停止條件不同，逐一模擬。
+    """
+    months = SIMULATION_MONTHS
+    pool = get_pool()
+    workers = pool_workers() if pool is not None else 1
+
+    scenarios = [[Scenario(name="Baseline")] + request.scenarios for request in requests]
+    groups: Dict[Hashable, List[int]] = {}
+    adaptive: List[int] = []
+    for index, request in enumerate(requests):
+        if request.quantile_tolerance is not None:
+            adaptive.append(index)
+        else:
+            groups.setdefault(_batch_group_key(request), []).append(index)
+
+    # 每塊：(待模擬的列, 各列屬於哪個請求, 結果：Future、延後執行的參數或 None)
+    chunks: List[Tuple[_PendingRows, List[int], Any]] = []
+    remaining = [len(rows) for rows in scenarios]
+    finished: List[List[Optional[ScenarioResult]]] = [[None] * len(rows) for rows in scenarios]
+    try:
+        for members in groups.values():
+            run = requests[members[0]]
+            market_core = _market_core(run)
+            seed = run.seed if run.seed is not None else int(np.random.SeedSequence().generate_state(1)[0])
+            rows = [(requests[i], scenario) for i in members for scenario in scenarios[i]]
+            owners = [i for i in members for _ in scenarios[i]]
+            size = _batch_chunk_rows(len(rows), run.paths, run.precision, workers)
+            for start in range(0, len(rows), size):
+                pending = _prepare_rows(run, rows[start:start + size], months)
+                task = None
+                if pending.missing:
+                    task = dict(
+                        months=months,
+                        plans=pending.plans,
+                        market=market_core,
+                        paths=run.paths,
+                        seed=seed,
+                        keep_paths=False,
+                        percentiles=run.extra_percentiles,
+                        block_months=plan_block_months(len(pending.plans), run.paths, months, run.precision),
+                        dtype=run.precision,
+                        quantile_months=line_chart_months(run.line_chart, months),
+                        cache_returns=run.seed is not None,
+                    )
+                    if pool is not None and not is_deterministic(market_core):
+                        task = pool.submit(_run_batch_task, task)
+                chunks.append((pending, owners[start:start + size], task))
+
+        for pending, owners, task in chunks:
+            if isinstance(task, dict):
+                batch = _run_batch_task(task)
+            else:
+                batch = task.result() if task is not None else None
+            for owner, result in zip(owners, _finish_rows(pending, batch)):
+                row = len(scenarios[owner]) - remaining[owner]
+                finished[owner][row] = result
+                remaining[owner] -= 1
+                if remaining[owner] == 0:
+                    yield owner, _batch_output(requests[owner], scenarios[owner], finished[owner], months)
+                    finished[owner] = []
+    finally:
+        # 出錯或呼叫端提前結束（例如串流的連線中斷）時，取消還沒開始的工作
+        for _, _, task in chunks:
+            if task is not None and not isinstance(task, dict):
+                task.cancel()
+
+    for index in adaptive:
+        yield index, _simulation_output(requests[index])
+
+
+def _batch_output(
+    request: SimulationRequest,
+    scenarios: List[Scenario],
+    scenario_results: List[Optional[ScenarioResult]],
+    months: int,
+) -> Dict[str, Any]:
+    return _assemble_output(
+        request,
+        scenarios,
+        [result for result in scenario_results if result is not None],
+        expenses_to_dict(request.expenses),
+        _market_core(request),
+        months,
+    )
+
+
+def simulate_batch_body(
+    requests: List[SimulationRequest], fmt: str = "json", encoding: Optional[str] = None
+) -> Tuple[bytes, Optional[str]]:
+    """{"results": [...]}（順序與 requests 相同），序列化與壓縮方式同 simulate_financial_plan_body"""
+    outputs: List[Optional[Dict[str, Any]]] = [None] * len(requests)
+    for index, output in simulate_batch(requests):
+        outputs[index] = output
+    return compress(encode_result({"results": outputs}, fmt), encoding)
+
+
+def iter_batch_events(requests: List[SimulationRequest]) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """串流版的 simulate_batch_body：每個請求完成就產生 ("result", {"index", ...輸出})，最後 ("done", {"count"})"""
+    count = 0
+    for index, output in simulate_batch(requests):
+        count += 1
+        yield "result", {"index": index, **to_jsonable(output)}
+    yield "done", {"count": count}
+
+
+def _sweep_axes(grid: SweepGrid) -> List[Tuple[str, Optional[str], List[float]]]:
+    # (欄位, 支出類別, 值)；空的軸不掃描
+    axes: List[Tuple[str, Optional[str], List[float]]] = []
+    if grid.invest_ratio:
+        axes.append(("invest_ratio", None, list(grid.invest_ratio)))
+    if grid.income_monthly:
+        axes.append(("income_monthly", None, list(grid.income_monthly)))
+    for category, values in grid.expenses_delta.items():
+        if values:
+            axes.append(("expenses_delta", category, list(values)))
+    return axes
+
+
+def sweep_points(grid: SweepGrid) -> int:
+    """格點數（各軸長度的乘積）；沒有任何軸時為 0"""
+    axes = _sweep_axes(grid)
+    return int(np.prod([len(values) for _, _, values in axes])) if axes else 0
+
+
+def _sweep_plans(request: SimulationSweepRequest, axes: List[Tuple[str, Optional[str], List[float]]]) -> List[ScenarioPlan]:
+    # 每個格點是批次引擎的一個情境列（依軸的順序 row-major 展開）
+    base = request.base
+    base_expenses = expenses_to_dict(base.expenses)
+    plans = []
+    for point in itertools.product(*(values for _, _, values in axes)):
+        invest_ratio, income, delta = base.invest_ratio, base.income_monthly, {}
+        for (field, category, _), value in zip(axes, point):
+            if field == "invest_ratio":
+                invest_ratio = value
+            elif field == "income_monthly":
+                income = value
+            else:
+                delta[category] = value
+        plans.append(
+            ScenarioPlan(
+                name="sweep",
+                income_monthly=income,
+                expenses_monthly=apply_expenses_delta(base_expenses, delta),
+                invest_ratio=invest_ratio,
+                initial_assets=base.initial_assets,
+            )
+        )
+    return plans
+
+
+def simulate_sweep(request: SimulationSweepRequest) -> Dict[str, Any]:
+    """
+    參數掃描：格點展開成情境列，整個格點共用同一組月報酬，
+    依記憶體預算切塊跑 run_paths（工作量大時分給 process pool），只計算期末月份的分位數。
+    回傳熱圖：axes（每軸的欄位與值）、shape，以及期末 P05/P50/P95（shape 同格點，numpy 陣列）。
+    """
+    base = request.base
+    months = SIMULATION_MONTHS
+    axes = _sweep_axes(request.grid)
+    shape = tuple(len(values) for _, _, values in axes)
+    plans = _sweep_plans(request, axes)
+    market_core = _market_core(base)
+    # 沒有 seed 時抽一個種子，讓所有切塊仍然共用同一組月報酬
+    seed = base.seed if base.seed is not None else int(np.random.SeedSequence().generate_state(1)[0])
+    returns = shared_monthly_returns(market_core, months, base.paths, base.seed)
+    final_month = np.array([months - 1])
+
+    size = _batch_chunk_rows(len(plans), base.paths, base.precision, 1)
+    finals = []
+    for start in range(0, len(plans), size):
+        chunk = plans[start:start + size]
+        batch = run_paths_parallel(
+            months=months,
+            plans=chunk,
+            market=market_core,
+            paths=base.paths,
+            seed=seed,
+            percentiles=(),
+            returns=returns,
+            block_months=plan_block_months(len(chunk), base.paths, months, base.precision),
+            dtype=base.precision,
+            quantile_months=final_month,
+            cache_returns=base.seed is not None,
+        )
+        finals.append(np.stack([batch.band(q)[:, -1] for q in LINE_PERCENTILES]))
+    final = np.concatenate(finals, axis=1).astype(np.float64)
+    return {
+        "axes": [
+            {"field": field, **({"category": category} if category is not None else {}), "values": values}
+            for field, category, values in axes
+        ],
+        "shape": list(shape),
+        **{f"p{q:02d}": final[row].reshape(shape) for row, q in enumerate(LINE_PERCENTILES)},
+        "paths": base.paths,
     }
+
+
+def simulate_sweep_body(
+    request: SimulationSweepRequest, fmt: str = "json", encoding: Optional[str] = None
+) -> Tuple[bytes, Optional[str]]:
+    """序列化（並壓縮）的 simulate_sweep 結果；有 seed 時以請求雜湊快取，同 simulate_financial_plan_body"""
+    cache_key = None
+    if request.base.seed is not None:
+        cache_key = f"sweep:{canonical_hash(request.model_dump(mode='json'))}:{fmt}:{encoding}"
+        cached = _result_cache.get(cache_key)
+        if cached is not None:
+            return cached
+    entry = compress(encode_result(simulate_sweep(request), fmt), encoding)
+    if cache_key is not None:
+        _result_cache.set(cache_key, entry)
+    return entry
+
+
+def _result_cache_key(request: SimulationRequest) -> Optional[str]:
+    # 沒有 seed 的結果是隨機的，不快取
+    if request.seed is None:
+        return None
+    return canonical_hash(request.model_dump(mode="json"))
+
+
+def cached_simulation_body(
+    request: SimulationRequest, fmt: str = "json", encoding: Optional[str] = None
+) -> Optional[Tuple[bytes, Optional[str]]]:
+    """只查結果快取，不做模擬（讓快取命中的請求不必排進模擬佇列）"""
+    key = _result_cache_key(request)
+    return _result_cache.get(f"{key}:{fmt}:{encoding}") if key is not None else None
+
+
+def simulate_financial_plan_body(
+    request: SimulationRequest,
+    fmt: str = "json",
+    encoding: Optional[str] = None,
+    check_cache: bool = True,
+    baseline: Optional[CompiledBaseline] = None,
+) -> Tuple[bytes, Optional[str]]:
+    """
+    回傳已序列化（fmt："json" / "msgpack"）、視需要壓縮過（encoding："gzip" / "br"）的內容，
+    以及實際使用的 Content-Encoding（內容太小時不壓縮，為 None）。
+    有 seed 的請求結果是確定的：以「正規化後的請求雜湊 + 格式 + 壓縮方式」為 key 快取，
+    命中時同時省下模擬、序列化與壓縮。呼叫端已經查過快取時可傳 check_cache=False。
+    baseline：見 _simulation_output。
+    """
+    key = _result_cache_key(request)
+    cache_key = f"{key}:{fmt}:{encoding}"
+    if key is not None and check_cache:
+        cached = _result_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+    entry = compress(encode_result(_simulation_output(request, baseline=baseline), fmt), encoding)
+
+    if key is not None:
+        _result_cache.set(cache_key, entry)
+    return entry
+
+
+def cached_simulation_json(request: SimulationRequest) -> Optional[bytes]:
+    """只查結果快取中未壓縮的 JSON"""
+    cached = cached_simulation_body(request)
+    return cached[0] if cached is not None else None
+
+
+def simulate_financial_plan_json(request: SimulationRequest, check_cache: bool = True) -> bytes:
+    """回傳未壓縮的 JSON bytes（見 simulate_financial_plan_body）"""
+    return simulate_financial_plan_body(request, check_cache=check_cache)[0]
+
+
+def simulation_cache_stats() -> Dict[str, Any]:
+    return {"results": _result_cache.stats(), "scenarios": _scenario_cache.stats()}
@@ -10,14 +10,14 @@ except ImportError:  # Allow running without package context
     from database.UserDB import create, login, modify_data  # type: ignore
 
 
-def user_register(request: UserRegisterReq) -> bool:
+async def user_register(request: UserRegisterReq) -> bool:
     if request.password != request.confirmPwd:
         return False
-    return create(request.email, request.username, request.password)
+    return await create(request.email, request.username, request.password)
 
 
-def user_login(request: UserLoginReq) -> Optional[UserLoginResp]:
-    user_record = login(request.email)
+async def user_login(request: UserLoginReq) -> Optional[UserLoginResp]:
+    user_record = await login(request.email)
     if not user_record:
         return None
     if user_record.get("password") != request.password:
@@ -33,10 +33,10 @@ def user_login(request: UserLoginReq) -> Optional[UserLoginResp]:
         username=str(username),
     )
 
-def user_modify_data(request: UserModifyDataReq) -> bool:
-    user_record = login(request.email)
+async def user_modify_data(request: UserModifyDataReq) -> bool:
+    user_record = await login(request.email)
     if not user_record:
         return False
     if user_record.get("password") != request.old_password:
         return False
-    return modify_data(request.user_id, request.username, request.new_password)
\ No newline at end of file
+    return await modify_data(request.user_id, request.username, request.new_password)
\ No newline at end of file
@@ -0,0 +1,84 @@
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+try:
+    from ..models.FinancialSettingResp import FinancialSettingResp
+    from ..models.SimulationReq import Expenses, MarketModel, Scenario, SimulationRequest
+    from .CacheService import LRUCache
+    from .SimulationDispatcher import simulation_dispatcher
+    from .FinancialSettingService import get_financial_setting_body
+    from .SimulationService import CompiledBaseline, compile_baseline
+except ImportError:  # Allow running without package context
+    from models.FinancialSettingResp import FinancialSettingResp  # type: ignore
+    from models.SimulationReq import Expenses, MarketModel, Scenario, SimulationRequest  # type: ignore
+    from services.CacheService import LRUCache  # type: ignore
+    from services.SimulationDispatcher import simulation_dispatcher  # type: ignore
+    from services.FinancialSettingService import get_financial_setting_body  # type: ignore
+    from services.SimulationService import CompiledBaseline, compile_baseline  # type: ignore
+
+
+__all__ = ["request_from_setting", "get_user_baseline", "user_baseline_cache_stats"]
+
+load_dotenv()
+
+# 每個使用者編譯好的 baseline（含預先生成的月報酬）；以財務設定的 ETag 判斷是否過期
+USER_BASELINE_CACHE_MAX_BYTES = int(os.getenv("USER_BASELINE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+USER_BASELINE_CACHE_TTL_SECONDS = float(os.getenv("USER_BASELINE_CACHE_TTL_SECONDS", "600"))
+
+# riskMode（前端設定頁的 "high" / "low" / "fixed"）→ MarketModel.profile
+RISK_PROFILES = {"high": "high_risk", "low": "low_risk"}
+
+# 值為 (財務設定的 ETag, CompiledBaseline)
+_baseline_cache = LRUCache(
+    USER_BASELINE_CACHE_MAX_BYTES, USER_BASELINE_CACHE_TTL_SECONDS, sizeof=lambda entry: entry[1].nbytes
+)
+
+
+def request_from_setting(setting: FinancialSettingResp, scenarios: List[Scenario]) -> SimulationRequest:
+    """
+    把儲存的財務設定轉成 SimulationRequest，規則與前端 Dashboard.jsx 原本組請求的方式相同：
+    - fixedReturn > 0 → 固定報酬，否則常態分佈
+    - riskMode "high" / "low" → high_risk / low_risk，其餘 custom
+    - 沒有 fixedReturn 時固定報酬率用 0.05；投資比例、paths、seed 用 SimulationRequest 的預設值
+    """
+    fixed_return = setting.fixedReturn or 0.0
+    return SimulationRequest(
+        initial_assets=setting.totalAsset or 0.0,
+        income_monthly=setting.monthlyIncome,
+        expenses=[Expenses(category=item.category, amount=item.amount) for item in setting.expenses],
+        market_model=MarketModel(
+            mode="fixed" if fixed_return > 0 else "normal",
+            profile=RISK_PROFILES.get(setting.riskMode, "custom"),
+            fixed_annual_return=setting.fixedReturn or 0.05,
+        ),
+        scenarios=scenarios,
+    )
+
+
+async def get_user_baseline(user_id: int) -> Optional[CompiledBaseline]:
+    """
+    使用者的 CompiledBaseline；沒有財務設定時回傳 None。
+    財務設定本身走 FinancialSettingService 的快取，設定一改 ETag 就不同，這裡的項目隨之重新編譯
+    （共享快取時多個 worker 也會一致）。
+    編譯（生成共用月報酬）在模擬派送器上執行，不佔用 event loop；佇列滿時丟出 SimulationBusyError。
+    """
+    cached = await get_financial_setting_body(user_id)
+    if cached is None:
+        _baseline_cache.invalidate(user_id)
+        return None
+    body, etag = cached
+
+    entry: Optional[Tuple[str, CompiledBaseline]] = _baseline_cache.get(user_id)
+    if entry is not None and entry[0] == etag:
+        return entry[1]
+
+    setting = FinancialSettingResp.model_validate_json(body)
+    baseline = await simulation_dispatcher.run(compile_baseline, request_from_setting(setting, []))
+    _baseline_cache.set(user_id, (etag, baseline))
+    return baseline
+
+
+def user_baseline_cache_stats() -> Dict[str, Any]:
+    return _baseline_cache.stats()
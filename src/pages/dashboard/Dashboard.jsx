@@ -3,7 +3,6 @@ import { Box, Grid } from "@mui/material";
 import StatCards from "../../components/Dashboard/StatCards";
 import AssetLineChart from "../../components/Dashboard/AssetLineChart";
 import ExpensePieChart from "../../components/Dashboard/ExpensePieChart";
-import { getFinancialSetting } from "../../api/financialSetting";
 import ScenarioCard from "../../components/Scenario/ScenarioCard";
 import ScenarioFullEditModal from "../../components/Scenario/ScenarioFullEditModal";
 
@@ -63,16 +62,12 @@ export default function Dashboard() {
 
     // --- 核心函式：執行模擬 (API Call) ---
     // 關鍵修正：這裡接收 currentScenarios 作為參數，確保拿到最新的
-    const runSimulation = async (settings, currentScenarios) => {
-        if (!settings) return;
+    // 財務設定由後端直接讀取（/simulate/user/{user_id}），這裡只送情境卡
+    const runSimulation = async (userId, currentScenarios) => {
+        if (!userId) return;
         setLoading(true);
 
         try {
-            const expensesArray = settings.expenses.map(exp => ({
-                category: exp.category,
-                amount: exp.amount
-            }));
-
             // 整理傳給後端的格式 (只取需要的欄位)
             const apiScenarios = currentScenarios.map(s => ({
                 name: s.name,
@@ -81,23 +76,10 @@ export default function Dashboard() {
                 invest_ratio_delta: s.invest_ratio_delta,
                 events: s.events
             }));
-            const response = await fetch("http://localhost:8000/simulate", {
+            const response = await fetch(`http://localhost:8000/simulate/user/${userId}`, {
                 method: "POST",
                 headers: { "Content-Type": "application/json" },
-                body: JSON.stringify({
-                    initial_assets: settings.totalAsset || 0,
-                    income_monthly: settings.monthlyIncome,
-                    expenses: expensesArray,
-                    invest_ratio: settings.investRatio || 0.2,
-                    market_model: {
-                        mode: settings.fixedReturn && settings.fixedReturn > 0 ? "fixed" : "normal",
-                        profile: settings.riskMode === "high" ? "high_risk" : settings.riskMode === "low" ? "low_risk" : "custom",
-                        fixed_annual_return: settings.fixedReturn || 0.05
-                    },
-                    scenarios: apiScenarios, // 這裡用傳入的參數，而不是 State
-                    paths: 1000,
-                    seed: 12345
-                })
+                body: JSON.stringify(apiScenarios) // 這裡用傳入的參數，而不是 State
             });
 
             if (!response.ok) throw new Error(`模擬失敗: ${response.status}`);
@@ -117,10 +99,8 @@ export default function Dashboard() {
             const user = JSON.parse(localStorage.getItem("user"));
             if (!user?.user_id) return;
 
-            const settings = await getFinancialSetting(user.user_id);
-            console.log('[User Setting]', settings);
-            // 每次都直接用最新 settings 執行模擬
-            await runSimulation(settings, scenarios);
+            // 後端每次都用最新 settings 執行模擬
+            await runSimulation(user.user_id, scenarios);
         };
         initDashboard();
     }, []);
@@ -154,11 +134,10 @@ export default function Dashboard() {
 
         setEditOpen(false);
 
-        // 4. 重新抓最新設定再執行模擬
+        // 4. 重新執行模擬（後端使用最新設定）
         const user = JSON.parse(localStorage.getItem("user"));
         if (user?.user_id) {
-            const settings = await getFinancialSetting(user.user_id);
-            await runSimulation(settings, newScenarios);
+            await runSimulation(user.user_id, newScenarios);
         }
     };
 